@@ -3,18 +3,34 @@ Clean FastAPI backend for Hong Kong Species data
 """
 
 import os
-import gc
+import gzip
 import json
 import logging
-from typing import Optional
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Literal, Optional
 
 import pandas as pd
 import geopandas as gpd
-from fastapi import FastAPI, HTTPException, Query
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 import uvicorn
 
+from data_processor import HKSpeciesDataProcessor, district_geojson_name, district_tolerance_for_zoom
+from species_search import SpeciesSearchIndex
+from map_aggregation import aggregate_occurrences
+import vector_tiles
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,8 +50,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Pre-computed, compressed map payloads written by data_processor.py
+SPECIES_GEOJSON_DIR = Path("processed/species_geojson")
+DISTRICTS_GEOJSON_DIR = Path("processed/districts_geojson")
+
+SPECIES_LOCATIONS_PATH = "processed/species_locations.parquet"
+
 # Global data storage - lazy loaded
-_species_index = None
+_occurrence_dataset = None  # (store version, dataset) of the occurrence store
+_occurrence_dataset_lock = threading.Lock()
+_species_summary = None
+_species_listing = None
+_search_index = None
 _data_summary = None
 _districts_cache = None
 _global_predictor = None
@@ -44,18 +70,215 @@ _global_predictor = None
 _global_predictor = None
 logger.info("⚠️ Prediction model will initialize on first use to save memory")
 
-def get_species_index():
-    """Lazy load species index"""
-    global _species_index
-    if _species_index is None:
+# Parquet reads, reprojection and JSON encoding run here instead of on the event loop;
+# the bound keeps a burst of map requests from holding every core
+BLOCKING_WORKERS = int(os.environ.get("API_BLOCKING_WORKERS", 4))
+_blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="api-blocking")
+_inflight = {}  # key -> asyncio.Future of the computation shared by concurrent requests
+_coalesced_requests = 0
+
+async def run_blocking(func, *args):
+    """Run a blocking function in the bounded executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, partial(func, *args))
+
+async def run_coalesced(key, func, *args):
+    """Run a blocking function once for all concurrent requests with the same key
+    
+    Later requests await the computation already in flight. The computation is
+    shielded, so a client disconnecting does not cancel it for the others.
+    """
+    global _coalesced_requests
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(run_blocking(func, *args))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        _coalesced_requests += 1
+    return await asyncio.shield(future)
+
+def get_species_summary():
+    """Lazy load the per-species summary table, indexed and sorted by scientific name"""
+    global _species_summary, _species_listing, _search_index
+    if _species_summary is None:
         try:
-            with open("processed/species_index.json") as f:
-                _species_index = json.load(f)
-            logger.info(f"Loaded species index with {len(_species_index)} species")
+            _species_summary = pd.read_parquet("processed/species_summary.parquet")
+            logger.info(f"Loaded species summary with {len(_species_summary)} species")
         except Exception as e:
-            logger.error(f"Failed to load species index: {e}")
-            _species_index = {}
-    return _species_index
+            # Data processed before the summary table existed: derive it from the occurrences
+            logger.warning(f"Species summary unavailable ({e}), deriving it from occurrences")
+            try:
+                occurrences = pd.read_parquet(
+                    SPECIES_LOCATIONS_PATH,
+                    columns=["scientific_name", "family", "name_en", "date"]
+                )
+                _species_summary = HKSpeciesDataProcessor.generate_species_summary(occurrences)
+                del occurrences
+            except Exception as e:
+                logger.error(f"Failed to load species summary: {e}")
+                _species_summary = pd.DataFrame(
+                    columns=["scientific_name", "family", "occurrences_count", "districts_count", "latest_date"]
+                )
+        _species_summary = _species_summary.set_index("scientific_name").sort_index()
+        _search_index = SpeciesSearchIndex.from_species_summary(_species_summary)
+        _species_listing = None
+        species_list_page.cache_clear()
+    return _species_summary
+
+def get_search_index():
+    """Trigram search index, built together with the species summary"""
+    get_species_summary()
+    return _search_index
+
+async def load_species_summary():
+    """Species summary table; the first call loads it in the executor, not on the event loop"""
+    if _species_summary is not None:
+        return _species_summary
+    return await run_coalesced(("species_summary",), get_species_summary)
+
+async def species_exists(species_name: str) -> bool:
+    return species_name in (await load_species_summary()).index
+
+def summary_record(species_name: str) -> dict:
+    """Listing/search fields for one species from the summary table"""
+    row = get_species_summary().loc[species_name]
+    return {
+        "scientific_name": species_name,
+        "family": row["family"] if pd.notnull(row["family"]) else "Unknown",
+        "districts_count": int(row["districts_count"]),
+        "occurrences_count": int(row["occurrences_count"]),
+        "latest_date": row["latest_date"]
+    }
+
+# Sort keys for /api/species/list; ties are broken by scientific name
+SPECIES_SORT_COLUMNS = {
+    "name": ["scientific_name"],
+    "family": ["family", "scientific_name"],
+    "occurrences": ["occurrences_count", "scientific_name"],
+    "latest_date": ["latest_date", "scientific_name"],
+}
+
+def get_species_listing():
+    """Listing records plus their precomputed order for every sort key"""
+    global _species_listing
+    if _species_listing is None:
+        summary = get_species_summary().reset_index()
+        records = [
+            {
+                "scientific_name": name,
+                "family": family if pd.notnull(family) else "Unknown",
+                "occurrences_count": int(count),
+                "latest_date": latest_date
+            }
+            for name, family, count, latest_date in zip(
+                summary["scientific_name"], summary["family"],
+                summary["occurrences_count"], summary["latest_date"]
+            )
+        ]
+        orders = {
+            sort: summary.sort_values(columns, kind="stable").index.to_numpy()
+            for sort, columns in SPECIES_SORT_COLUMNS.items()
+        }
+        _species_listing = {"records": records, "orders": orders}
+    return _species_listing
+
+@lru_cache(maxsize=256)
+def species_list_page(sort: str, order: str, offset: int, limit: int) -> bytes:
+    """Serialized listing page; cached until the species summary is reloaded"""
+    listing = get_species_listing()
+    positions = listing["orders"][sort]
+    if order == "desc":
+        positions = positions[::-1]
+    page = [listing["records"][position] for position in positions[offset:offset + limit]]
+    next_offset = offset + limit if offset + limit < len(positions) else None
+    
+    return json.dumps({
+        "species": page,
+        "total": len(page),
+        "total_available": len(positions),
+        "offset": offset,
+        "next_offset": next_offset
+    }).encode("utf-8")
+
+def file_version(path) -> Optional[tuple]:
+    """Modification time and size of a file, or None if it is missing"""
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def get_occurrence_dataset() -> ds.Dataset:
+    """Occurrence store with its row group statistics read once, not on every filtered read
+    
+    The dataset is reopened when the data processor rewrites the store, since
+    the cached row group offsets no longer match the new file.
+    """
+    global _occurrence_dataset
+    version = file_version(SPECIES_LOCATIONS_PATH)
+    with _occurrence_dataset_lock:
+        if _occurrence_dataset is None or _occurrence_dataset[0] != version:
+            dataset = ds.dataset(SPECIES_LOCATIONS_PATH, format="parquet")
+            for fragment in dataset.get_fragments():
+                fragment.ensure_complete_metadata()
+            _occurrence_dataset = (version, dataset)
+        return _occurrence_dataset[1]
+
+def clear_occurrence_dataset():
+    global _occurrence_dataset
+    with _occurrence_dataset_lock:
+        _occurrence_dataset = None
+
+def occurrence_filter(species_name: str, start_year: Optional[int] = None,
+                      end_year: Optional[int] = None, month: Optional[int] = None) -> ds.Expression:
+    """Filter for one species' occurrences, optionally within a year range and calendar month
+    
+    The store is sorted by species and date, with small species sharing row
+    groups and large ones split by year range, so the species and date bounds
+    skip row groups from their statistics; month only filters rows.
+    """
+    expression = pc.field("scientific_name") == species_name
+    date_type = get_occurrence_dataset().schema.field("date").type
+    if start_year is not None:
+        expression &= pc.field("date") >= pa.scalar(datetime(start_year, 1, 1), date_type)
+    if end_year is not None:
+        expression &= pc.field("date") < pa.scalar(datetime(end_year + 1, 1, 1), date_type)
+    if month is not None:
+        expression &= pc.month(pc.field("date")) == month
+    return expression
+
+def read_occurrences(species_name: str, columns: Optional[list] = None, start_year: Optional[int] = None,
+                     end_year: Optional[int] = None, month: Optional[int] = None) -> pa.Table:
+    return get_occurrence_dataset().to_table(
+        columns=columns, filter=occurrence_filter(species_name, start_year, end_year, month)
+    )
+
+def load_species_details(species_name: str, start_year: Optional[int] = None,
+                         end_year: Optional[int] = None, month: Optional[int] = None) -> dict:
+    """Load a species' location list on demand, in the species index schema"""
+    occurrences = read_occurrences(
+        species_name, ["family", "name_en", "lat", "lon", "date"], start_year, end_year, month
+    ).to_pandas()
+    record = summary_record(species_name)
+    if (start_year, end_year, month) != (None, None, None):
+        # Latest record within the requested period
+        record["latest_date"] = occurrences["date"].max().isoformat() if len(occurrences) else None
+    return {
+        "scientific_name": species_name,
+        "family": record["family"],
+        "districts": occurrences["name_en"].unique().tolist(),
+        "locations": [
+            {"lat": lat, "lon": lon, "district": district, "date": date}
+            for lat, lon, district, date in zip(
+                occurrences["lat"].tolist(),
+                occurrences["lon"].tolist(),
+                occurrences["name_en"].tolist(),
+                occurrences["date"].map(lambda d: d.isoformat()).tolist()
+            )
+        ],
+        "latest_date": record["latest_date"]
+    }
 
 def get_data_summary():
     """Lazy load data summary"""
@@ -70,17 +293,216 @@ def get_data_summary():
             _data_summary = {}
     return _data_summary
 
-def load_species_locations(species_name: str):
+def load_species_locations(species_name: str, start_year: Optional[int] = None,
+                           end_year: Optional[int] = None, month: Optional[int] = None):
     """Load specific species location data on demand"""
-    try:
-        df = gpd.read_parquet("processed/species_locations.parquet")
-        species_data = df[df['scientific_name'] == species_name].copy()
-        del df
-        gc.collect()
-        return species_data
-    except Exception as e:
-        logger.error(f"Failed to load species locations for {species_name}: {e}")
-        return gpd.GeoDataFrame()
+    # The filter is pushed down, so only the requested species' row groups are decoded
+    return gpd.GeoDataFrame.from_arrow(read_occurrences(species_name, None, start_year, end_year, month))
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Check conditional request headers against a file's validators"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def read_gzip(path: Path) -> bytes:
+    return gzip.decompress(path.read_bytes())
+
+async def precompressed_response(request: Request, path: Path, media_type: str = "application/json"):
+    """Serve the pre-compressed copies of a file written by the data processor.
+    
+    Returns None when no compressed copy exists so callers can fall back to
+    building the payload themselves.
+    """
+    gzip_path = path.with_name(path.name + ".gz")
+    if not gzip_path.exists():
+        return None
+    
+    accepted = {
+        encoding.split(";")[0].strip()
+        for encoding in request.headers.get("accept-encoding", "").split(",")
+    }
+    blob_path, encoding = gzip_path, "gzip"
+    brotli_path = path.with_name(path.name + ".br")
+    if "br" in accepted and brotli_path.exists():
+        blob_path, encoding = brotli_path, "br"
+    
+    stat = blob_path.stat()
+    decompress = encoding not in accepted
+    # Decompressed bytes are a different representation of the blob, so they get their own validator
+    representation = "-identity" if decompress else ""
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{representation}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    
+    if is_not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+    
+    if decompress:
+        # Rare clients without gzip support get the decompressed bytes
+        payload = await run_coalesced(("decompress", str(blob_path), etag), read_gzip, blob_path)
+        return Response(payload, media_type=media_type, headers=headers)
+    
+    headers["Content-Encoding"] = encoding
+    return FileResponse(blob_path, media_type=media_type, headers=headers)
+
+def build_species_geojson(species_name: str, start_year: Optional[int] = None,
+                          end_year: Optional[int] = None, month: Optional[int] = None) -> Optional[bytes]:
+    """Reproject a species' occurrences to an encoded GeoJSON FeatureCollection, or None if it has none"""
+    species_data = load_species_locations(species_name, start_year, end_year, month)
+    if species_data.empty:
+        return None
+    
+    if 'date' in species_data.columns:
+        species_data['date'] = species_data['date'].dt.strftime('%Y-%m-%d')
+    
+    species_data_wgs84 = species_data.to_crs('EPSG:4326')
+    geojson = json.loads(species_data_wgs84.to_json())
+    
+    return json.dumps({"type": "FeatureCollection", "features": geojson["features"]}).encode("utf-8")
+
+def build_species_aggregate(species_name: str, mode: str, resolution: float, by_year: bool,
+                            start_year: Optional[int] = None, end_year: Optional[int] = None,
+                            month: Optional[int] = None) -> Optional[bytes]:
+    """Encoded FeatureCollection of a species' per-cell occurrence counts, or None if it has none"""
+    occurrences = gpd.GeoDataFrame.from_arrow(
+        read_occurrences(species_name, ["date", "geometry"], start_year, end_year, month)
+    )
+    if occurrences.empty:
+        return None
+    
+    # Binned in the stored metric CRS (Hong Kong 1980 Grid); polygons count at their centroid
+    geojson = aggregate_occurrences(occurrences.geometry.centroid, occurrences["date"].dt.year.to_numpy(),
+                                    mode, resolution, by_year)
+    return json.dumps(geojson).encode("utf-8")
+
+def build_districts_geojson() -> Optional[bytes]:
+    """Encoded WGS84 GeoJSON FeatureCollection of the districts, or None if they are unavailable"""
+    districts = get_districts()
+    if districts.empty:
+        return None
+    
+    districts_copy = districts.copy()
+    
+    for col in districts_copy.columns:
+        if districts_copy[col].dtype == 'datetime64[ns]':
+            districts_copy[col] = districts_copy[col].dt.strftime('%Y-%m-%d')
+    
+    districts_wgs84 = districts_copy.to_crs('EPSG:4326')
+    geojson = json.loads(districts_wgs84.to_json())
+    
+    return json.dumps({"type": "FeatureCollection", "features": geojson["features"]}).encode("utf-8")
+
+def load_prediction(species_name: str, grid_size: int, format: str = "geojson"):
+    """Cached 2025 prediction for a species as GeoJSON or as its likelihood grid, or None"""
+    from precompute_predictions import get_cached_grid, get_cached_prediction
+    if format == "grid":
+        return get_cached_grid(species_name, grid_size)
+    return get_cached_prediction(species_name, grid_size)
+
+TILE_PROPERTIES = {
+    "occurrences": ["scientific_name", "family", "date", "name_en"],
+    "districts": ["name_en", "name_tc", "area_code"],
+    "predictions": ["prediction_id", "likelihood"],
+}
+TILE_SOURCE_CACHE_SIZE = 16
+_tile_sources = OrderedDict()  # (layer, species, grid_size) -> (source version, frame), least recent first
+_tile_source_locks = {}  # (layer, species, grid_size) -> lock held while that source loads
+_tile_sources_lock = threading.Lock()
+
+def tile_source_version(layer: str, species_name: Optional[str], grid_size: int) -> Optional[tuple]:
+    """Modification time and size of the file a tile layer is read from, or None if it is missing"""
+    if layer == "predictions":
+        from precompute_predictions import prediction_version
+        return prediction_version(species_name, grid_size)
+    return file_version("processed/districts.parquet" if layer == "districts" else SPECIES_LOCATIONS_PATH)
+
+def load_tile_source(layer: str, species_name: Optional[str], grid_size: int) -> Optional[gpd.GeoDataFrame]:
+    """Web Mercator features of a tile layer with their spatial index built; None if unavailable"""
+    if layer == "districts":
+        frame = get_districts()
+    elif layer == "occurrences":
+        frame = load_species_locations(species_name)
+        if 'date' in frame.columns:
+            frame['date'] = frame['date'].dt.strftime('%Y-%m-%d')
+    else:
+        prediction = load_prediction(species_name, grid_size)
+        if prediction is None:
+            return None
+        frame = gpd.GeoDataFrame.from_features(prediction["features"], crs="EPSG:4326")
+    
+    if frame.empty:
+        return None
+    frame = frame.to_crs("EPSG:3857")
+    # Accessing sindex builds the spatial index; do it once per source here
+    # rather than inside the first tile request
+    frame.sindex
+    return frame
+
+def get_tile_source(layer: str, species_name: Optional[str], grid_size: int) -> Optional[gpd.GeoDataFrame]:
+    """Tile layer source, kept for the tiles that follow while its file is unchanged
+    
+    One thread loads each source while that source's other tiles wait for it;
+    different sources load in parallel. Unavailable sources are not kept, so
+    they appear as soon as the data processor or precompute has written them.
+    """
+    key = (layer, species_name, grid_size)
+    with _tile_sources_lock:
+        lock = _tile_source_locks.setdefault(key, threading.Lock())
+    
+    with lock:
+        version = tile_source_version(*key)
+        with _tile_sources_lock:
+            cached = _tile_sources.get(key)
+            if cached is not None and cached[0] == version:
+                _tile_sources.move_to_end(key)
+                return cached[1]
+        
+        frame = load_tile_source(*key)
+        with _tile_sources_lock:
+            if frame is None:
+                _tile_sources.pop(key, None)
+            else:
+                _tile_sources[key] = (version, frame)
+                _tile_sources.move_to_end(key)
+                while len(_tile_sources) > TILE_SOURCE_CACHE_SIZE:
+                    _tile_sources.popitem(last=False)
+        return frame
+
+def clear_tile_sources():
+    with _tile_sources_lock:
+        _tile_sources.clear()
+
+def build_tile(layer: str, species_name: Optional[str], grid_size: int, z: int, x: int, y: int) -> Optional[bytes]:
+    """Encoded tile from the on-disk tile cache, encoding and caching it on a miss"""
+    key = "all" if layer == "districts" else species_name
+    if layer == "predictions":
+        key = f"{species_name}@{grid_size}"
+    path = vector_tiles.tile_cache_path(layer, key, z, x, y)
+    tile = vector_tiles.read_cached_tile(path)
+    if tile is not None:
+        return tile
+    
+    frame = get_tile_source(layer, species_name, grid_size)
+    if frame is None:
+        return None
+    
+    tile = vector_tiles.encode_tile(layer, frame, z, x, y, TILE_PROPERTIES[layer])
+    vector_tiles.write_cached_tile(path, tile)
+    return tile
 
 def get_districts():
     """Lazy load districts data"""
@@ -108,65 +530,58 @@ async def get_summary():
     return get_data_summary()
 
 @app.get("/api/species/list")
-async def get_all_species(limit: int = Query(100, le=500)):
-    """Get list of all available species"""
-    species_index = get_species_index()
-    
-    species_list = []
-    for name, data in list(species_index.items())[:limit]:
-        species_list.append({
-            "scientific_name": name,
-            "family": data.get("family", "Unknown"),
-            "occurrences_count": len(data.get("locations", []))
-        })
-    
-    species_list.sort(key=lambda x: x["scientific_name"])
-    
-    return {
-        "species": species_list, 
-        "total": len(species_list),
-        "total_available": len(species_index)
-    }
+async def get_all_species(
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0, description="Position to start from; use next_offset from the previous page"),
+    sort: Literal["name", "family", "occurrences", "latest_date"] = Query("name"),
+    order: Literal["asc", "desc"] = Query("asc")
+):
+    """Get a page of all available species"""
+    if _species_listing is None:
+        await load_species_summary()
+        await run_coalesced(("species_listing",), get_species_listing)
+    return Response(species_list_page(sort, order, offset, limit), media_type="application/json")
 
 @app.get("/api/species/search")
 async def search_species(
     q: str = Query(None, description="Species name to search"),
     limit: int = Query(50, le=100)
 ):
-    """Search for species by name"""
-    species_index = get_species_index()
+    """Search for species by name or family, ranked by match quality with typo tolerance"""
     matches = []
     
     if q:
-        q_lower = q.lower()
-        count = 0
-        for name, data in species_index.items():
-            if count >= limit:
-                break
-            if q_lower in name.lower():
-                matches.append({
-                    "scientific_name": name,
-                    "family": data.get("family", "Unknown"),
-                    "districts_count": len(data.get("districts", [])),
-                    "occurrences_count": len(data.get("locations", [])),
-                    "latest_date": data.get("latest_date", "Unknown")
-                })
-                count += 1
+        await load_species_summary()
+        for name in get_search_index().search(q, limit):
+            matches.append(summary_record(name))
     
     if not matches and q:
         raise HTTPException(status_code=404, detail="No species found matching query")
     
     return {"results": matches, "total": len(matches)}
 
+def check_period(start_year: Optional[int], end_year: Optional[int]):
+    if start_year is not None and end_year is not None and start_year > end_year:
+        raise HTTPException(status_code=400, detail="start_year must not be after end_year")
+
 @app.get("/api/species/{species_name}")
-async def get_species_details(species_name: str):
+async def get_species_details(
+    species_name: str,
+    start_year: Optional[int] = Query(None, ge=1900, le=2100, description="First year of occurrences to include"),
+    end_year: Optional[int] = Query(None, ge=1900, le=2100, description="Last year of occurrences to include"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Only include occurrences from this calendar month")
+):
     """Get detailed information for a specific species"""
-    species_index = get_species_index()
-    
-    if species_name not in species_index:
+    if not await species_exists(species_name):
         raise HTTPException(status_code=404, detail="Species not found")
+    check_period(start_year, end_year)
     
-    species_data = species_index[species_name]
+    try:
+        species_data = await run_coalesced(("details", species_name, start_year, end_year, month),
+                                           load_species_details, species_name, start_year, end_year, month)
+    except Exception as e:
+        logger.error(f"Failed to load details for {species_name}: {e}")
+        raise HTTPException(status_code=500, detail="Error loading species details")
     
     return {
         "species": species_data,
@@ -175,58 +590,70 @@ async def get_species_details(species_name: str):
     }
 
 @app.get("/api/species/{species_name}/map")
-async def get_species_map_data(species_name: str):
+async def get_species_map_data(
+    species_name: str,
+    request: Request,
+    aggregate: Optional[Literal["grid", "hex", "cluster"]] = Query(None, description="Return per-cell counts instead of every occurrence"),
+    resolution: float = Query(1000, ge=50, le=20000, description="Aggregation cell size in metres"),
+    by_year: bool = Query(False, description="Add per-year counts to each aggregated cell"),
+    start_year: Optional[int] = Query(None, ge=1900, le=2100, description="First year of occurrences to include"),
+    end_year: Optional[int] = Query(None, ge=1900, le=2100, description="Last year of occurrences to include"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Only include occurrences from this calendar month")
+):
     """Get GeoJSON map data for a specific species"""
-    species_index = get_species_index()
-    
-    if species_name not in species_index:
+    if not await species_exists(species_name):
         raise HTTPException(status_code=404, detail="Species not found")
+    check_period(start_year, end_year)
+    period = (start_year, end_year, month)
+    filtered = period != (None, None, None)
     
-    species_data = load_species_locations(species_name)
+    if aggregate is not None:
+        try:
+            geojson = await run_coalesced(("species_aggregate", species_name, aggregate, resolution, by_year, *period),
+                                          build_species_aggregate, species_name, aggregate, resolution, by_year, *period)
+        except Exception as e:
+            logger.error(f"Error aggregating map data for {species_name}: {e}")
+            raise HTTPException(status_code=500, detail="Error processing map data")
+    else:
+        # Serve the pre-projected GeoJSON from the data processor when available
+        if not filtered:
+            response = await precompressed_response(
+                request, SPECIES_GEOJSON_DIR / f"{species_name.replace(' ', '_')}.geojson"
+            )
+            if response is not None:
+                return response
+        
+        try:
+            geojson = await run_coalesced(("species_map", species_name, *period),
+                                          build_species_geojson, species_name, *period)
+        except Exception as e:
+            logger.error(f"Error processing map data for {species_name}: {e}")
+            raise HTTPException(status_code=500, detail="Error processing map data")
     
-    if species_data.empty:
+    if geojson is None:
+        # A known species with nothing in the requested period is an empty map, not a missing one
+        if filtered:
+            return {"type": "FeatureCollection", "features": []}
         raise HTTPException(status_code=404, detail="No location data found")
     
-    try:
-        if 'date' in species_data.columns:
-            species_data['date'] = species_data['date'].dt.strftime('%Y-%m-%d')
-        
-        species_data_wgs84 = species_data.to_crs('EPSG:4326')
-        geojson = json.loads(species_data_wgs84.to_json())
-        
-        del species_data, species_data_wgs84
-        gc.collect()
-        
-        return {"type": "FeatureCollection", "features": geojson["features"]}
-        
-    except Exception as e:
-        logger.error(f"Error processing map data for {species_name}: {e}")
-        raise HTTPException(status_code=500, detail="Error processing map data")
+    return Response(geojson, media_type="application/json")
 
 @app.get("/api/species/{species_name}/predict-2025")
-async def predict_species_2025(species_name: str):
+async def predict_species_2025(
+    species_name: str,
+    grid_size: int = Query(20, ge=2, le=200, description="Grid bins per axis, as passed to precompute_predictions.py --grid-size"),
+    format: Literal["geojson", "grid"] = Query("geojson", description="GeoJSON grid boxes, or the raw likelihood grid with its WGS84 cell corners")
+):
     """Get pre-computed 2025 predictions for a specific species"""
-    species_index = get_species_index()
-    
-    if species_name not in species_index:
+    if not await species_exists(species_name):
         raise HTTPException(status_code=404, detail="Species not found")
     
     try:
-        from precompute_predictions import get_cached_prediction
-        
         logger.info(f"📂 Getting cached prediction for {species_name}")
         
         # Get pre-computed prediction
-        prediction = get_cached_prediction(species_name)
-        
-        if prediction is None:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"No 2025 predictions available for {species_name}. This species may have insufficient historical data for prediction modeling."
-            )
-        
-        logger.info(f"✅ Returned cached prediction for {species_name}: {prediction['prediction_info']['predicted_locations']} locations")
-        return prediction
+        prediction = await run_coalesced(("prediction", species_name, grid_size, format),
+                                         load_prediction, species_name, grid_size, format)
         
     except Exception as e:
         logger.error(f"❌ Prediction error for {species_name}: {e}")
@@ -234,11 +661,23 @@ async def predict_species_2025(species_name: str):
             status_code=500,
             detail="Prediction service temporarily unavailable"
         )
+    
+    if prediction is None:
+        raise HTTPException(
+            status_code=404, 
+            detail=f"No 2025 predictions available for {species_name} on a {grid_size}x{grid_size} grid. This species may have insufficient historical data for prediction modeling."
+        )
+    
+    if format == "grid":
+        logger.info(f"✅ Returned cached prediction grid for {species_name}")
+    else:
+        logger.info(f"✅ Returned cached prediction for {species_name}: {prediction['prediction_info']['predicted_locations']} locations")
+    return prediction
 
 @app.get("/api/districts")
 async def get_districts_list():
     """Get list of all districts"""
-    districts = get_districts()
+    districts = _districts_cache if _districts_cache is not None else await run_coalesced(("districts",), get_districts)
     
     district_list = []
     for _, district in districts.iterrows():
@@ -251,31 +690,65 @@ async def get_districts_list():
     return {"districts": district_list}
 
 @app.get("/api/districts/map")
-async def get_districts_map():
+async def get_districts_map(
+    request: Request,
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Web map zoom level; coarser zooms get simplified boundaries")
+):
     """Get GeoJSON map data for Hong Kong districts"""
-    districts = get_districts()
-    
-    if districts.empty:
-        raise HTTPException(status_code=404, detail="Districts data not available")
+    # Serve the pre-simplified GeoJSON from the data processor when available
+    response = await precompressed_response(
+        request, DISTRICTS_GEOJSON_DIR / district_geojson_name(district_tolerance_for_zoom(zoom))
+    )
+    if response is not None:
+        return response
     
     try:
-        districts_copy = districts.copy()
-        
-        for col in districts_copy.columns:
-            if districts_copy[col].dtype == 'datetime64[ns]':
-                districts_copy[col] = districts_copy[col].dt.strftime('%Y-%m-%d')
-        
-        districts_wgs84 = districts_copy.to_crs('EPSG:4326')
-        geojson = json.loads(districts_wgs84.to_json())
-        
-        del districts_copy, districts_wgs84
-        gc.collect()
-        
-        return {"type": "FeatureCollection", "features": geojson["features"]}
-        
+        geojson = await run_coalesced(("districts_map",), build_districts_geojson)
     except Exception as e:
         logger.error(f"Error processing districts map data: {e}")
         raise HTTPException(status_code=500, detail="Error processing districts map data")
+    
+    if geojson is None:
+        raise HTTPException(status_code=404, detail="Districts data not available")
+    
+    return Response(geojson, media_type="application/json")
+
+@app.get("/tiles/{layer}/{z}/{x}/{y}.mvt")
+async def get_vector_tile(
+    layer: Literal["occurrences", "districts", "predictions"],
+    z: int,
+    x: int,
+    y: int,
+    species: Optional[str] = Query(None, description="Scientific name; required for occurrences and predictions"),
+    grid_size: int = Query(20, ge=2, le=200, description="Prediction grid bins per axis")
+):
+    """Get a Mapbox vector tile of occurrences, districts or 2025 prediction grid boxes"""
+    if vector_tiles.mapbox_vector_tile is None:
+        raise HTTPException(status_code=501, detail="Vector tiles need the mapbox-vector-tile package")
+    if not vector_tiles.is_valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    if layer != "districts":
+        if not species:
+            raise HTTPException(status_code=400, detail=f"The {layer} layer needs a species")
+        if not await species_exists(species):
+            raise HTTPException(status_code=404, detail="Species not found")
+    else:
+        species = None
+    
+    try:
+        tile = await run_coalesced(("tile", layer, species, grid_size, z, x, y),
+                                   build_tile, layer, species, grid_size, z, x, y)
+    except Exception as e:
+        logger.error(f"Error building {layer} tile {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail="Error building tile")
+    
+    if tile is None:
+        raise HTTPException(status_code=404, detail=f"No {layer} data available")
+    
+    headers = {"Cache-Control": "no-cache"}
+    if not tile:
+        return Response(status_code=204, headers=headers)
+    return Response(tile, media_type="application/vnd.mapbox-vector-tile", headers=headers)
 
 @app.get("/api/map/bounds")
 async def get_map_bounds():
@@ -305,7 +778,10 @@ async def get_cache_info():
     """Get prediction model cache information"""
     try:
         from species_inference import get_cache_info
-        return get_cache_info()
+        from precompute_predictions import get_predictions_cache_info
+        cache_info = get_cache_info()
+        cache_info["predictions_cache"] = get_predictions_cache_info()
+        return cache_info
     except Exception as e:
         return {"error": str(e)}
 
@@ -314,7 +790,11 @@ async def clear_cache():
     """Clear prediction model cache to free memory"""
     try:
         from species_inference import clear_model_cache
+        from precompute_predictions import clear_predictions_cache
         clear_model_cache()
+        clear_predictions_cache()
+        clear_occurrence_dataset()
+        clear_tile_sources()
         return {"message": "Cache cleared successfully"}
     except Exception as e:
         return {"error": str(e)}
@@ -338,22 +818,29 @@ async def get_status():
     return {
         "status": "running",
         "memory_usage_mb": round(memory_info.rss / 1024 / 1024, 2),
-        "species_loaded": len(get_species_index()),
+        "species_loaded": len(await load_species_summary()),
         "data_summary_loaded": bool(_data_summary),
-        "districts_loaded": bool(_districts_cache),
+        "districts_loaded": _districts_cache is not None and not _districts_cache.empty,
         "prediction_model_ready": _global_predictor is not None,
-        "cached_models": cache_info.get("cached_models", 0)
+        "cached_models": cache_info.get("cached_models", 0),
+        "blocking_workers": BLOCKING_WORKERS,
+        "inflight_computations": len(_inflight),
+        "coalesced_requests": _coalesced_requests
     }
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     host = "0.0.0.0"
     
-    logger.info(f"Starting server on {host}:{port}")
+    # Workers share the memory-mapped species tensor and on-disk stores through
+    # the page cache, so WEB_CONCURRENCY can be raised up to the core count
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    
+    logger.info(f"Starting server on {host}:{port} with {workers} worker(s)")
     uvicorn.run(
-        app, 
+        "app:app" if workers > 1 else app, 
         host=host, 
         port=port,
-        workers=1,
+        workers=workers,
         access_log=False
     )
\ No newline at end of file
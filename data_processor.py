@@ -5,20 +5,58 @@ Cleans and optimizes geospatial datasets for API consumption
 """
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+import shapely
+import argparse
+import io
+import gzip
 import json
+import math
+import os
+import shutil
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
+import time
+
+from species_ingest import read_species_years
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rows per row group of the occurrence store: smaller species share a row group
+# until it reaches this size, larger ones are split into row groups by year range
+SPECIES_ROW_GROUP_MIN_ROWS = 16384
+
+# Simplification tolerances, in metres, of the precomputed district map GeoJSON;
+# 0 keeps the full-resolution boundaries
+DISTRICT_SIMPLIFY_TOLERANCES = (0, 10, 40, 150)
+
+def district_geojson_name(tolerance: int) -> str:
+    return f"districts_{tolerance}m.geojson"
+
+def district_tolerance_for_zoom(zoom: Optional[float]) -> int:
+    """Coarsest precomputed tolerance within half a web map pixel at zoom; full resolution without a zoom"""
+    if zoom is None:
+        return 0
+    # Web Mercator ground resolution at Hong Kong's latitude
+    pixel_size = 156543.03 * math.cos(math.radians(22.3)) / 2 ** zoom
+    return max(tolerance for tolerance in DISTRICT_SIMPLIFY_TOLERANCES if tolerance <= pixel_size / 2)
+
 class HKSpeciesDataProcessor:
-    def __init__(self, data_dir: str = "."):
+    def __init__(self, data_dir: str = ".", district_method: str = "overlay", sparse_layers: bool = False):
         self.data_dir = Path(data_dir)
         self.output_dir = self.data_dir / "processed"
         self.output_dir.mkdir(exist_ok=True)
+        self.district_method = district_method
+        self.sparse_layers = sparse_layers
         
     def load_raw_data(self) -> Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
         """Load and validate raw shapefiles"""
@@ -28,21 +66,8 @@ class HKSpeciesDataProcessor:
         districts = gpd.read_file(self.data_dir / 'boundaries/Hong_Kong_District_Boundary.shp')
         logger.info(f"Loaded {len(districts)} districts")
         
-        # Load all species data from 2001-2024
-        species_list = []
-        for year in range(2001, 2025):
-            file_path = self.data_dir / f'species/O{year}.shp'
-            if file_path.exists():
-                year_data = gpd.read_file(file_path)
-                year_data['year'] = year
-                species_list.append(year_data)
-                logger.info(f"Loaded {len(year_data)} records from {year}")
-            else:
-                logger.warning(f"File not found: {file_path}")
-        
-        # Combine all years
-        species = pd.concat(species_list, ignore_index=True)
-        logger.info(f"Total loaded: {len(species)} species records from all years")
+        # Load all species data from 2001-2024, reading the years concurrently
+        species = read_species_years(self.data_dir / 'species', range(2001, 2025))
         
         return districts, species
     
@@ -85,59 +110,269 @@ class HKSpeciesDataProcessor:
         return species_clean
     
     def create_species_district_mapping(self, species: gpd.GeoDataFrame, 
-                                      districts: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-        """Create spatial overlay mapping species to districts"""
-        logger.info("Creating species-district spatial mapping...")
-        
-        # Spatial overlay
-        species_districts = gpd.overlay(species, districts, how='intersection')
+                                      districts: gpd.GeoDataFrame,
+                                      method: str = None) -> gpd.GeoDataFrame:
+        """Create spatial mapping of species to districts
+        
+        'overlay', the default, splits every occurrence polygon along district
+        boundaries. 'sjoin' assigns each whole occurrence to the district
+        containing its representative point, which is much faster on large
+        inputs but gives one unclipped row per occurrence, so geometries and
+        per-district counts differ from overlay's.
+        """
+        method = method or self.district_method
+        logger.info(f"Creating species-district spatial mapping ({method})...")
+        start = time.perf_counter()
+        
+        if method == 'overlay':
+            # Spatial overlay
+            species_districts = gpd.overlay(species, districts, how='intersection')
+        elif method == 'sjoin':
+            species_districts = self.assign_districts(species, districts)
+        else:
+            raise ValueError(f"Unknown district mapping method: {method}")
         
         # Add centroid coordinates for map display
         centroids = species_districts.geometry.centroid
         species_districts['lat'] = centroids.y
         species_districts['lon'] = centroids.x
         
+        logger.info(f"Mapped {len(species_districts)} occurrences in {time.perf_counter() - start:.1f}s")
         return species_districts
     
+    def assign_districts(self, species: gpd.GeoDataFrame, 
+                         districts: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """Assign each occurrence to one district with an STRtree point-in-polygon lookup"""
+        occurrence_geoms = species.geometry.values
+        district_geoms = districts.geometry.values
+        
+        # Representative points always lie inside their polygon; the tree
+        # evaluates 'within' against prepared district geometries
+        tree = shapely.STRtree(district_geoms)
+        points = shapely.point_on_surface(occurrence_geoms)
+        occurrence_idx, district_idx = tree.query(points, predicate='within')
+        occurrence_idx, first = np.unique(occurrence_idx, return_index=True)
+        district_idx = district_idx[first]
+        
+        # Occurrences whose point falls just outside every district (e.g. at sea)
+        # go to the district they overlap most, as overlay would have kept them
+        missing = np.setdiff1d(np.arange(len(species)), occurrence_idx)
+        if len(missing):
+            pair_occ, pair_district = tree.query(occurrence_geoms[missing], predicate='intersects')
+            areas = shapely.area(shapely.intersection(occurrence_geoms[missing][pair_occ],
+                                                      district_geoms[pair_district]))
+            order = np.lexsort((-areas, pair_occ))
+            pair_occ, best = np.unique(pair_occ[order], return_index=True)
+            occurrence_idx = np.concatenate([occurrence_idx, missing[pair_occ]])
+            district_idx = np.concatenate([district_idx, pair_district[order][best]])
+            order = np.argsort(occurrence_idx, kind='stable')
+            occurrence_idx, district_idx = occurrence_idx[order], district_idx[order]
+        
+        matched = species.iloc[occurrence_idx].reset_index(drop=True)
+        district_attrs = districts.drop(columns=districts.geometry.name).iloc[district_idx].reset_index(drop=True)
+        return gpd.GeoDataFrame(
+            pd.concat([matched.drop(columns=matched.geometry.name), district_attrs,
+                       matched[[matched.geometry.name]]], axis=1),
+            geometry=matched.geometry.name, crs=species.crs
+        )
+    
+    def compare_district_methods(self, species: gpd.GeoDataFrame, 
+                                 districts: gpd.GeoDataFrame) -> Dict:
+        """Time both district mapping methods and check their labels agree"""
+        species = species.assign(occurrence_id=np.arange(len(species)))
+        timings = {}
+        results = {}
+        for method in ('overlay', 'sjoin'):
+            start = time.perf_counter()
+            results[method] = self.create_species_district_mapping(species, districts, method=method)
+            timings[method] = time.perf_counter() - start
+        
+        # An sjoin label agrees when overlay produced a piece of that occurrence in the same district
+        overlay_pairs = set(zip(results['overlay']['occurrence_id'], results['overlay']['name_en']))
+        sjoin_pairs = list(zip(results['sjoin']['occurrence_id'], results['sjoin']['name_en']))
+        agreeing = sum(pair in overlay_pairs for pair in sjoin_pairs)
+        comparison = {
+            'overlay_seconds': timings['overlay'],
+            'sjoin_seconds': timings['sjoin'],
+            'speedup': timings['overlay'] / timings['sjoin'],
+            'overlay_rows': len(results['overlay']),
+            'sjoin_rows': len(results['sjoin']),
+            'label_agreement': agreeing / len(sjoin_pairs) if sjoin_pairs else 1.0
+        }
+        logger.info(f"District mapping: overlay {comparison['overlay_seconds']:.1f}s, "
+                    f"sjoin {comparison['sjoin_seconds']:.1f}s ({comparison['speedup']:.1f}x), "
+                    f"label agreement {comparison['label_agreement']:.2%}")
+        return comparison
+    
     def generate_species_index(self, species_districts: gpd.GeoDataFrame) -> Dict:
         """Generate searchable species index"""
         logger.info("Generating species search index...")
         
-        species_index = {}
-        
-        for _, row in species_districts.iterrows():
-            name = row['scientific_name']
-            if name not in species_index:
-                species_index[name] = {
-                    'scientific_name': name,
-                    'family': row['family'],
-                    'districts': set(),
-                    'locations': [],
-                    'latest_date': row['date']
-                }
-            
-            # Add district
-            species_index[name]['districts'].add(row['name_en'])
-            
-            # Add location
-            species_index[name]['locations'].append({
-                'lat': float(row['lat']),
-                'lon': float(row['lon']),
-                'district': row['name_en'],
-                'date': row['date'].isoformat()
-            })
-            
-            # Update latest date
-            if row['date'] > species_index[name]['latest_date']:
-                species_index[name]['latest_date'] = row['date']
+        # Species in order of first appearance; stable sort keeps each species' rows in order
+        codes, names = pd.factorize(species_districts['scientific_name'], use_na_sentinel=False)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        
+        # Format each distinct date once instead of once per row
+        date_codes, unique_dates = pd.factorize(species_districts['date'])
+        iso_dates = np.array([d.isoformat() for d in unique_dates] + [None], dtype=object)[date_codes]
+        
+        district_names = species_districts['name_en'].to_numpy()
+        locations = [
+            {'lat': lat, 'lon': lon, 'district': district, 'date': date}
+            for lat, lon, district, date in zip(
+                species_districts['lat'].astype(float).tolist(),
+                species_districts['lon'].astype(float).tolist(),
+                district_names.tolist(),
+                iso_dates.tolist()
+            )
+        ]
+        
+        grouped = species_districts.groupby(codes, sort=True)
+        latest_dates = grouped['date'].max()
+        first_rows = order[bounds[:-1]]
+        families = species_districts['family'].to_numpy()[first_rows]
         
-        # Convert sets to lists for JSON serialization
-        for species_data in species_index.values():
-            species_data['districts'] = list(species_data['districts'])
-            species_data['latest_date'] = species_data['latest_date'].isoformat()
+        species_index = {}
+        for code, name in enumerate(names):
+            rows = order[bounds[code]:bounds[code + 1]]
+            species_index[name] = {
+                'scientific_name': name,
+                'family': families[code],
+                'districts': pd.unique(district_names[rows]).tolist(),
+                'locations': [locations[i] for i in rows],
+                'latest_date': latest_dates.iloc[code].isoformat()
+            }
         
         return species_index
     
+    @staticmethod
+    def generate_species_summary(species_districts: pd.DataFrame) -> pd.DataFrame:
+        """Generate compact per-species summary table for listing and search"""
+        logger.info("Generating species summary table...")
+        
+        summary = species_districts.groupby('scientific_name').agg(
+            family=('family', 'first'),
+            occurrences_count=('scientific_name', 'size'),
+            districts_count=('name_en', 'nunique'),
+            latest_date=('date', 'max')
+        ).reset_index()
+        summary['latest_date'] = summary['latest_date'].map(lambda d: d.isoformat())
+        
+        return summary
+    
+    @staticmethod
+    def species_row_group_sizes(names: np.ndarray, years: np.ndarray, min_rows: int) -> List[int]:
+        """Row group lengths for rows sorted by species and date
+
+        Consecutive species with at most min_rows rows share a row group until
+        it holds min_rows rows; as rows are sorted by name, each group still
+        covers a narrow name range for min/max pruning. Species with more than
+        min_rows rows get their own groups, cut at year boundaries into groups
+        of at least min_rows rows, so date filters can skip the years outside
+        their range.
+        """
+        sizes = []
+        shared = 0
+        species_starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+        for start, end in zip(species_starts, np.r_[species_starts[1:], len(names)]):
+            if end - start <= min_rows:
+                shared += end - start
+                if shared >= min_rows:
+                    sizes.append(shared)
+                    shared = 0
+                continue
+            if shared:
+                sizes.append(shared)
+                shared = 0
+            year_starts = start + 1 + np.flatnonzero(years[start + 1:end] != years[start:end - 1])
+            group_start = start
+            for boundary in year_starts:
+                if boundary - group_start >= min_rows:
+                    sizes.append(boundary - group_start)
+                    group_start = boundary
+            sizes.append(end - group_start)
+        if shared:
+            sizes.append(shared)
+        return sizes
+    
+    def save_species_partitions(self, species_districts: gpd.GeoDataFrame, path: Path):
+        """Save occurrences sorted by species and date, in row groups by species and year range"""
+        species_sorted = species_districts.sort_values(
+            ['scientific_name', 'date'], kind='stable').reset_index(drop=True)
+        
+        # Let geopandas encode the geometry and GeoParquet metadata once
+        buffer = io.BytesIO()
+        species_sorted.to_parquet(buffer)
+        table = pq.read_table(buffer)
+        
+        # Each write_table call becomes its own row group, so the name and date
+        # min/max statistics let readers skip other species and years. Every row
+        # group repeats its column dictionaries, so small species are packed together
+        sizes = self.species_row_group_sizes(species_sorted['scientific_name'].to_numpy(),
+                                             species_sorted['date'].dt.year.to_numpy(),
+                                             SPECIES_ROW_GROUP_MIN_ROWS)
+        
+        # Min/max of WKB bytes cannot prune anything and bloat the footer
+        statistics = [name for name in table.schema.names if name != species_sorted.geometry.name]
+        # Row groups are written one at a time, so write beside the store and rename
+        # it into place; the API never reads a half-written file
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with pq.ParquetWriter(tmp_path, table.schema, write_statistics=statistics) as writer:
+            offset = 0
+            for size in sizes:
+                writer.write_table(table.slice(offset, size))
+                offset += size
+        os.replace(tmp_path, path)
+        
+        logger.info(f"Saved {species_sorted['scientific_name'].nunique()} species in {len(sizes)} row groups to {path}")
+    
+    def save_compressed(self, path: Path, payload: bytes):
+        """Save gzip (and brotli, if installed) copies of a payload next to path"""
+        # mtime=0 keeps the gzip bytes, and so the served ETag, stable across runs
+        with open(path.with_name(path.name + '.gz'), 'wb') as f:
+            f.write(gzip.compress(payload, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path.with_name(path.name + '.br'), 'wb') as f:
+                f.write(brotli.compress(payload))
+    
+    def save_species_geojson(self, species_districts: gpd.GeoDataFrame):
+        """Save ready-to-serve WGS84 GeoJSON for each species' map"""
+        geojson_dir = self.output_dir / 'species_geojson'
+        geojson_dir.mkdir(exist_ok=True)
+        
+        # Reproject and format dates once for all species, in the occurrence
+        # store's order so the blobs match the API's uncompressed fallback
+        species_wgs84 = species_districts.sort_values(
+            ['scientific_name', 'date'], kind='stable').to_crs('EPSG:4326')
+        species_wgs84['date'] = species_wgs84['date'].dt.strftime('%Y-%m-%d')
+        
+        for name, group in species_wgs84.groupby('scientific_name', sort=False):
+            # Feature ids count from 0 within each species, as in the fallback
+            payload = group.reset_index(drop=True).to_json().encode('utf-8')
+            self.save_compressed(geojson_dir / f"{name.replace(' ', '_')}.geojson", payload)
+        
+        logger.info(f"Saved species map GeoJSON to {geojson_dir}")
+    
+    def save_districts_geojson(self, districts: gpd.GeoDataFrame):
+        """Save ready-to-serve WGS84 district GeoJSON at each simplification tolerance"""
+        geojson_dir = self.output_dir / 'districts_geojson'
+        geojson_dir.mkdir(exist_ok=True)
+        
+        for tolerance in DISTRICT_SIMPLIFY_TOLERANCES:
+            simplified = districts.copy()
+            if tolerance:
+                try:
+                    # Shared borders are simplified once, so neighbouring districts still meet exactly
+                    simplified['geometry'] = districts.geometry.simplify_coverage(tolerance)
+                except Exception as e:
+                    logger.warning(f"Coverage simplification unavailable ({e}), simplifying districts one by one")
+                    simplified['geometry'] = districts.geometry.simplify(tolerance, preserve_topology=True)
+            
+            payload = simplified.to_crs('EPSG:4326').to_json().encode('utf-8')
+            self.save_compressed(geojson_dir / district_geojson_name(tolerance), payload)
+            logger.info(f"Saved district map GeoJSON at {tolerance} m tolerance ({len(payload)} bytes)")
+    
     def save_processed_data(self, districts: gpd.GeoDataFrame, 
                           species_districts: gpd.GeoDataFrame,
                           species_index: Dict):
@@ -150,12 +385,21 @@ class HKSpeciesDataProcessor:
         
         # Save as Parquet for fast loading
         districts.to_parquet(self.output_dir / 'districts.parquet')
-        species_districts.to_parquet(self.output_dir / 'species_locations.parquet')
+        self.save_species_partitions(species_districts, self.output_dir / 'species_locations.parquet')
+        self.save_species_geojson(species_districts)
+        self.save_districts_geojson(districts)
+        
+        # Vector tiles are cut from the files above on demand; drop the stale ones
+        shutil.rmtree(self.output_dir / 'tiles', ignore_errors=True)
         
         # Save species index as JSON
         with open(self.output_dir / 'species_index.json', 'w') as f:
             json.dump(species_index, f, indent=2)
         
+        # Save the slim summary the API keeps in memory; locations are read per species
+        species_summary = self.generate_species_summary(species_districts)
+        species_summary.to_parquet(self.output_dir / 'species_summary.parquet', index=False)
+        
         # Generate summary statistics
         stats = {
             'total_species': len(species_index),
@@ -174,6 +418,22 @@ class HKSpeciesDataProcessor:
         logger.info(f"Processed data saved to {self.output_dir}")
         return stats
     
+    def save_training_artifact(self, species_raw: gpd.GeoDataFrame):
+        """Save the predictor's binned species layers so it can skip the raw shapefiles"""
+        logger.info("Saving binned species layers for the predictor...")
+        try:
+            # Imported here so API processes using this module don't load torch
+            from species_inference import Species
+            
+            predictor = Species(species_df=species_raw)
+            predictor.prepare_data()
+            predictor.get_species_names()
+            predictor.species_layer(predictor.species_df, sparse=self.sparse_layers)
+            predictor.save_artifact(self.output_dir / 'species_layers.npz')
+            logger.info(f"Saved layers for {len(predictor.species_names)} species")
+        except Exception as e:
+            logger.warning(f"Skipping species layers artifact: {e}")
+    
     def process_all(self) -> Dict:
         """Run complete data processing pipeline"""
         logger.info("Starting data processing pipeline...")
@@ -189,16 +449,36 @@ class HKSpeciesDataProcessor:
         species_districts = self.create_species_district_mapping(species_clean, districts_clean)
         
         # Generate search index
+        start = time.perf_counter()
         species_index = self.generate_species_index(species_districts)
+        logger.info(f"Indexed {len(species_districts) / (time.perf_counter() - start):,.0f} rows/sec")
         
         # Save processed data
         stats = self.save_processed_data(districts_clean, species_districts, species_index)
+        self.save_training_artifact(species_raw)
         
         logger.info("Data processing pipeline completed!")
         return stats
 
 if __name__ == "__main__":
-    processor = HKSpeciesDataProcessor()
+    parser = argparse.ArgumentParser(description="Process Hong Kong species datasets for the API")
+    parser.add_argument("--district-method", choices=["overlay", "sjoin"], default="overlay",
+                        help="How occurrences are mapped to districts (default: overlay); sjoin is much "
+                             "faster but keeps whole occurrences, one row each, instead of clipping them to districts")
+    parser.add_argument("--compare-district-methods", action="store_true",
+                        help="Only time overlay against sjoin on the raw data and report label agreement")
+    parser.add_argument("--sparse-layers", action="store_true",
+                        help="Store only the occupied cells of the predictor's species layers")
+    args = parser.parse_args()
+    
+    processor = HKSpeciesDataProcessor(district_method=args.district_method,
+                                       sparse_layers=args.sparse_layers)
+    if args.compare_district_methods:
+        districts_raw, species_raw = processor.load_raw_data()
+        processor.compare_district_methods(processor.clean_species(species_raw),
+                                           processor.clean_districts(districts_raw))
+        raise SystemExit(0)
+    
     stats = processor.process_all()
     print(f"\nProcessing Summary:")
     print(f"- {stats['total_species']} unique species")
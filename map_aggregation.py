@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Vectorised aggregation of species occurrences for the map
+Bins projected points into square grid cells, hexagons or grid-based clusters with per-cell counts
+"""
+
+from typing import Dict, Optional
+
+import geopandas as gpd
+import numpy as np
+
+AGGREGATE_MODES = ("grid", "hex", "cluster")
+
+# Pointy-top hexagon vertex directions, starting from the upper right
+HEX_ANGLES = np.radians(np.arange(30, 390, 60))
+
+def grid_bins(x: np.ndarray, y: np.ndarray, resolution: float):
+    """Integer column and row of the resolution-sized square containing each point"""
+    return np.floor(x / resolution).astype(np.int64), np.floor(y / resolution).astype(np.int64)
+
+def hex_bins(x: np.ndarray, y: np.ndarray, resolution: float):
+    """Axial (q, r) of the pointy-top hexagon containing each point; resolution is the centre spacing"""
+    size = resolution / np.sqrt(3)
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+
+    # Cube rounding: round all three cube coordinates, then fix the one that moved most
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+def hex_centres(q: np.ndarray, r: np.ndarray, resolution: float):
+    size = resolution / np.sqrt(3)
+    return size * np.sqrt(3) * (q + r / 2), size * 1.5 * r
+
+def to_wgs84(x: np.ndarray, y: np.ndarray, crs) -> np.ndarray:
+    """(..., 2) array of rounded longitude/latitude for same-shaped projected coordinates"""
+    points = gpd.GeoSeries(gpd.points_from_xy(x.ravel(), y.ravel()), crs=crs).to_crs("EPSG:4326")
+    lonlat = np.stack([points.x.to_numpy(), points.y.to_numpy()], axis=-1)
+    # ~0.1 m, well below any aggregation resolution
+    return np.round(lonlat, 6).reshape(x.shape + (2,))
+
+def aggregate_occurrences(points: gpd.GeoSeries, years: np.ndarray, mode: str, resolution: float,
+                          by_year: bool = False) -> Dict:
+    """GeoJSON FeatureCollection of per-cell occurrence counts
+
+    points must be in a metric CRS. grid and hex return cell polygons; cluster
+    returns one point per grid cell at the mean position of its occurrences.
+    With by_year, each feature also carries its counts per year; years may be
+    NaN for undated occurrences, which count towards the cell but no year.
+    Empty or missing points are left out.
+    """
+    x, y = points.x.to_numpy(), points.y.to_numpy()
+    located = np.isfinite(x) & np.isfinite(y)
+    x, y, years = x[located], y[located], np.asarray(years, dtype=float)[located]
+    if mode == "hex":
+        a, b = hex_bins(x, y, resolution)
+    else:
+        a, b = grid_bins(x, y, resolution)
+
+    cells, inverse, counts = np.unique(np.stack([a, b], axis=1), axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    a, b = cells[:, 0], cells[:, 1]
+
+    if mode == "grid":
+        ring_x = (a[:, None] + np.array([0, 1, 1, 0, 0])) * resolution
+        ring_y = (b[:, None] + np.array([0, 0, 1, 1, 0])) * resolution
+        rings = to_wgs84(ring_x, ring_y, points.crs)
+    elif mode == "hex":
+        centre_x, centre_y = hex_centres(a, b, resolution)
+        size = resolution / np.sqrt(3)
+        angles = np.append(HEX_ANGLES, HEX_ANGLES[0])
+        rings = to_wgs84(centre_x[:, None] + size * np.cos(angles),
+                         centre_y[:, None] + size * np.sin(angles), points.crs)
+    else:
+        mean_x = np.bincount(inverse, weights=x) / counts
+        mean_y = np.bincount(inverse, weights=y) / counts
+        centres = to_wgs84(mean_x, mean_y, points.crs)
+
+    year_counts: Optional[np.ndarray] = None
+    if by_year:
+        dated = ~np.isnan(years)
+        year_values, year_idx = np.unique(years[dated].astype(np.int64), return_inverse=True)
+        year_counts = np.zeros((len(cells), len(year_values)), dtype=np.int64)
+        np.add.at(year_counts, (inverse[dated], year_idx.ravel()), 1)
+
+    features = []
+    for i, count in enumerate(counts.tolist()):
+        if mode == "cluster":
+            geometry = {"type": "Point", "coordinates": centres[i].tolist()}
+        else:
+            geometry = {"type": "Polygon", "coordinates": [rings[i].tolist()]}
+        properties = {"count": count}
+        if year_counts is not None:
+            properties["years"] = {
+                str(year): n for year, n in zip(year_values.tolist(), year_counts[i].tolist()) if n
+            }
+        features.append({"type": "Feature", "geometry": geometry, "properties": properties})
+
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "aggregation": {
+            "mode": mode,
+            "resolution": resolution,
+            "cells": len(features),
+            "occurrences": len(x)
+        }
+    }
@@ -1,171 +1,430 @@
 #!/usr/bin/env python3
 """
 Pre-compute all species predictions at startup
+Predictions are stored as likelihood grids packed into one memory-mapped file, see prediction_grid.py
 """
+import argparse
 import json
+import multiprocessing
 import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+import threading
 import time
-from species_inference import get_global_predictor, fast_predict_with_global_predictor
 
-def precompute_all_predictions():
-    """Pre-compute predictions for all species and save to disk"""
-    print("🚀 Starting prediction pre-computation...")
-    
-    # Initialize predictor
-    predictor = get_global_predictor()
-    
-    # Create predictions directory
-    predictions_dir = Path("predictions_cache")
-    predictions_dir.mkdir(exist_ok=True)
-    
-    # Track progress
-    total_species = len(predictor.species_names)
-    predictions_cache = {}
-    
-    print(f"📊 Pre-computing predictions for {total_species} species...")
+import numpy as np
+
+from prediction_grid import (PredictionGridStore, grid_to_geojson, likelihood_grid, prediction_grid_version,
+                             save_prediction_grid)
+from vector_tiles import clear_tile_cache
+from species_inference import (DEFAULT_GRID_SIZE, benchmark_grid_sizes, get_global_predictor,
+                               fast_predict_with_global_predictor)
+
+def train_species_batch(predictor, species_batch):
+    """Train models for a batch of species together, if batching is enabled"""
+    if len(species_batch) < 2:
+        return {}
+    try:
+        print(f"🎨 Training {len(species_batch)} CNN-LSTM models as one batch...")
+        return predictor.train_models_batched(species_batch)
+    except Exception as e:
+        # Fall back to the per-species path so one bad species only fails itself
+        print(f"⚠️ Batched training failed ({e}), training species one by one")
+        return {}
+
+def save_json_atomic(path, data):
+    """Write JSON to a temporary file and rename it into place"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def species_prediction_file(predictions_dir, species_name):
+    return predictions_dir / f"{species_name.replace(' ', '_')}.json"
+
+def species_grid_file(predictions_dir, species_name):
+    """Per-species likelihood grid, kept between runs and packed into the shared file"""
+    return predictions_dir / "grids" / f"{species_name.replace(' ', '_')}.npy"
+
+def species_fingerprint_file(predictions_dir, species_name):
+    """Fingerprint of the inputs a species' saved grid was computed from"""
+    return predictions_dir / "grids" / f"{species_name.replace(' ', '_')}.fingerprint"
+
+def save_text_atomic(path, text):
+    """Write text to a temporary file and rename it into place"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text)
+    os.replace(tmp_path, path)
+
+def load_fingerprint(predictions_dir, species_name):
+    """Fingerprint saved with a species' grid, or None if it has none"""
+    try:
+        return species_fingerprint_file(predictions_dir, species_name).read_text().strip()
+    except FileNotFoundError:
+        return None
+
+def save_grid_atomic(path, grid):
+    """Write a grid to a temporary file and rename it into place"""
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+    np.save(tmp_path, grid)
+    os.replace(tmp_path, path)
+
+def grid_predictions_dir(predictions_dir, grid_size):
+    """Predictions for the default grid live in predictions_dir itself, other grid sizes in a subdirectory"""
+    if grid_size == DEFAULT_GRID_SIZE:
+        return predictions_dir
+    return predictions_dir / f"grid_{grid_size}"
+
+def load_metadata(predictions_dir):
+    """Load metadata.json from a previous run, if any"""
+    metadata_file = predictions_dir / "metadata.json"
+    if not metadata_file.exists():
+        return {}
+    try:
+        with open(metadata_file, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable {metadata_file}: {e}")
+        return {}
+
+def precompute_species_batch(species_batch, predictions_dir, grid_size=DEFAULT_GRID_SIZE, write_geojson=False):
+    """Train, predict and save one batch of species; returns the names saved"""
+    predictor = get_global_predictor(grid_size)
+    trained_models = train_species_batch(predictor, species_batch)
+    saved = []
+    (predictions_dir / "grids").mkdir(exist_ok=True)
     
-    for i, species_name in enumerate(predictor.species_names):
+    for species_name in species_batch:
         try:
-            print(f"🔮 [{i+1}/{total_species}] Processing {species_name}...")
-            
-            # Train CNN-LSTM model and generate prediction
-            print(f"🎨 Training CNN-LSTM model for {species_name}...")
-            trained_model = predictor.train_model_fast(species_name)
+            # Train CNN-LSTM model unless it was trained with its batch
+            trained_model = trained_models.get(species_name)
+            if trained_model is None:
+                print(f"🎨 Training CNN-LSTM model for {species_name}...")
+                trained_model = predictor.train_model_fast(species_name)
             
             # Get predictions using CNN-LSTM model
-            result = predictor.inference_model(species_name, trained_model)
+            centroids, grid_bounds = predictor.inference_model(species_name, trained_model)
+            grid = likelihood_grid(grid_bounds, predictor.grid_size)
             
-            if not result:
-                prediction = None
-            else:
-                centroids, grid_bounds = result
-                
-                # Convert to GeoJSON format
-                import geopandas as gpd
-                from shapely.geometry import Point, box
-                
-                # Create features with grid boxes and likelihood values
-                features = []
-                for i, (centroid, bounds) in enumerate(zip(centroids, grid_bounds)):
-                    # Convert grid bounds to WGS84
-                    grid_box = box(bounds['x_min'], bounds['y_min'], bounds['x_max'], bounds['y_max'])
-                    grid_gdf = gpd.GeoDataFrame([1], geometry=[grid_box], crs=predictor.hkmap.crs)
-                    grid_wgs84 = grid_gdf.to_crs('EPSG:4326')
-                    
-                    # Get polygon coordinates
-                    poly_coords = list(grid_wgs84.geometry.iloc[0].exterior.coords)
-                    min_x, min_y = poly_coords[0]
-                    max_x, max_y = poly_coords[2]
-                    
-                    features.append({
-                        "type": "Feature",
-                        "geometry": {
-                            "type": "Polygon",
-                            "coordinates": [[
-                                [min_x, min_y], [max_x, min_y], [max_x, max_y], [min_x, max_y], [min_x, min_y]
-                            ]]
-                        },
-                        "properties": {
-                            "species_name": species_name,
-                            "prediction_year": 2025,
-                            "prediction_id": i + 1,
-                            "feature_type": "grid_box",
-                            "likelihood": float(bounds.get('likelihood', 1.0)) if bounds.get('likelihood', 1.0) > 0 else 0.0
-                        }
-                    })
-                
-                prediction = {
-                    "type": "FeatureCollection",
-                    "features": features,
-                    "prediction_info": {
-                        "species_name": species_name,
-                        "predicted_locations": len(centroids),
-                        "model_type": "CNN-LSTM",
-                        "prediction_year": 2025
-                    }
-                }
+            # Save individual prediction grid; readers never see a partial file
+            save_grid_atomic(species_grid_file(predictions_dir, species_name), grid)
+            if write_geojson:
+                prediction = grid_to_geojson(species_name, grid, *predictor.grid_lattice_wgs84())
+                save_json_atomic(species_prediction_file(predictions_dir, species_name), prediction)
             
-            if prediction:
-                # Save individual prediction file
-                species_file = predictions_dir / f"{species_name.replace(' ', '_')}.json"
-                with open(species_file, 'w') as f:
-                    json.dump(prediction, f, indent=2)
-                
-                # Add to cache
-                predictions_cache[species_name] = prediction
-                print(f"✅ Cached {len(prediction['features'])} predictions for {species_name}")
-            else:
-                print(f"⚠️ No predictions generated for {species_name}")
+            # Written last, so a run interrupted before this point recomputes the species
+            save_text_atomic(species_fingerprint_file(predictions_dir, species_name),
+                             predictor.species_fingerprint(species_name))
+            saved.append(species_name)
+            print(f"✅ Cached {len(centroids)} predictions for {species_name}")
                 
         except Exception as e:
             print(f"❌ Error processing {species_name}: {e}")
-            prediction = None
     
-    # Save master cache file
-    cache_file = predictions_dir / "all_predictions.json"
-    with open(cache_file, 'w') as f:
-        json.dump(predictions_cache, f, indent=2)
+    return saved
+
+def init_precompute_worker():
+    # One torch thread per worker process so N workers don't oversubscribe the CPU
+    import torch
+    torch.set_num_threads(1)
+
+def precompute_all_predictions(batch_size=1, workers=1, force=False, grid_size=DEFAULT_GRID_SIZE,
+                               grid_dtype="float32", write_geojson=False):
+    """Pre-compute predictions for all species and save to disk
+
+    With batch_size > 1, that many independent per-species models are trained
+    together as one grouped CNN-LSTM; the predictions are the same as training
+    them one at a time. With workers > 1, batches are spread over a process
+    pool. Each species' prediction is keyed by a fingerprint of its layer
+    tensor and the model settings, saved next to its grid as soon as the
+    species finishes; species whose fingerprint is unchanged are reused unless
+    force is set, so an interrupted or repeated run only retrains what changed. Each grid_size has its own
+    directory of predictions, see grid_predictions_dir.
+    
+    All species' likelihood grids are packed as grid_dtype into one
+    memory-mapped file for the API. write_geojson also writes the per-species
+    GeoJSON files and all_predictions.json of earlier versions.
+    """
+    print("🚀 Starting prediction pre-computation...")
+    
+    # Initialize predictor; forked workers inherit it, and its species tensor, read-only
+    predictor = get_global_predictor(grid_size)
     
-    # Save metadata
+    # Create predictions directory
+    predictions_dir = grid_predictions_dir(Path("predictions_cache"), grid_size)
+    predictions_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Reuse species whose inputs are unchanged since their prediction was saved
+    total_species = len(predictor.species_names)
+    # Directories from before per-species fingerprint files only have metadata.json
+    metadata_fingerprints = load_metadata(predictions_dir).get("fingerprints", {})
+    fingerprints = {name: predictor.species_fingerprint(name) for name in predictor.species_names}
+    pending_species = [
+        species_name for species_name in predictor.species_names
+        if force
+        or (load_fingerprint(predictions_dir, species_name)
+            or metadata_fingerprints.get(species_name)) != fingerprints[species_name]
+        or not species_grid_file(predictions_dir, species_name).exists()
+        or (write_geojson and not species_prediction_file(predictions_dir, species_name).exists())
+    ]
+    pending = set(pending_species)
+    reused_species = [name for name in predictor.species_names if name not in pending]
+    
+    print(f"📊 Pre-computing predictions for {len(pending_species)}/{total_species} species "
+          f"({len(reused_species)} unchanged)...")
+    
+    batches = [pending_species[i:i + batch_size] for i in range(0, len(pending_species), batch_size)]
+    done = 0
+    recomputed_species = []
+    if workers > 1:
+        mp_context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                 initializer=init_precompute_worker) as executor:
+            futures = {executor.submit(precompute_species_batch, batch, predictions_dir, grid_size, write_geojson): batch
+                       for batch in batches}
+            for future in as_completed(futures):
+                recomputed_species.extend(future.result())
+                done += len(futures[future])
+                print(f"🔮 [{done}/{len(pending_species)}] species processed")
+    else:
+        for batch in batches:
+            recomputed_species.extend(precompute_species_batch(batch, predictions_dir, grid_size, write_geojson))
+            done += len(batch)
+            print(f"🔮 [{done}/{len(pending_species)}] species processed")
+    
+    # Pack every species' grid, including ones reused from earlier runs
+    packed_species = [
+        species_name for species_name in predictor.species_names
+        if species_grid_file(predictions_dir, species_name).exists()
+    ]
+    grids = [np.load(species_grid_file(predictions_dir, species_name)) for species_name in packed_species]
+    save_prediction_grid(predictions_dir, packed_species, grids, *predictor.grid_lattice_wgs84(), dtype=grid_dtype)
+    
+    if write_geojson:
+        # Save master cache file
+        predictions_cache = {}
+        for species_name in packed_species:
+            species_file = species_prediction_file(predictions_dir, species_name)
+            if species_file.exists():
+                with open(species_file, 'r') as f:
+                    predictions_cache[species_name] = json.load(f)
+        save_json_atomic(predictions_dir / "all_predictions.json", predictions_cache)
+    
+    # Save metadata; species that failed this run get no fingerprint and are retried next time
     metadata = {
         "total_species": total_species,
-        "successful_predictions": len(predictions_cache),
+        "grid_size": grid_size,
+        "successful_predictions": len(packed_species),
+        "reused_predictions": len(reused_species),
+        "recomputed_predictions": len(recomputed_species),
         "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "species_list": list(predictions_cache.keys())
+        "species_list": packed_species,
+        "fingerprints": {name: fingerprints[name] for name in reused_species + recomputed_species}
     }
     
-    metadata_file = predictions_dir / "metadata.json"
-    with open(metadata_file, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    save_json_atomic(predictions_dir / "metadata.json", metadata)
+    clear_tile_cache("predictions")
     
     print(f"🎉 Pre-computation complete!")
-    print(f"📈 Generated predictions for {len(predictions_cache)}/{total_species} species")
+    print(f"♻️ Reused {len(reused_species)} unchanged predictions, recomputed {len(recomputed_species)}")
+    print(f"📈 Generated predictions for {len(packed_species)}/{total_species} species")
     print(f"💾 Cache saved to {predictions_dir}")
     
-    return predictions_cache
+    return packed_species
+
+class PredictionLRUCache:
+    """Size-bounded LRU cache of decoded per-species predictions"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (species_name, grid_size) -> (prediction, size in bytes)
+        self._lock = threading.Lock()
 
-def load_predictions_cache():
-    """Load pre-computed predictions from disk"""
-    # Try multiple possible cache locations
-    possible_paths = [
-        Path("predictions_cache/all_predictions.json"),
-        Path("./predictions_cache/all_predictions.json"),
-        Path(os.path.dirname(__file__)) / "predictions_cache/all_predictions.json",
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, prediction, size):
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # Entries larger than the whole budget are served but never kept
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (prediction, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "cached_predictions": len(self._entries),
+                "cache_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+def find_predictions_dir():
+    """Locate the per-species predictions directory"""
+    possible_dirs = [
+        Path("predictions_cache"),
+        Path(os.path.dirname(__file__)) / "predictions_cache",
     ]
-    
-    print(f"🔍 Current working directory: {os.getcwd()}")
-    
-    for cache_file in possible_paths:
-        print(f"🔍 Checking: {cache_file.absolute()}")
-        
-        if cache_file.exists():
-            try:
-                print(f"📂 Loading pre-computed predictions from {cache_file}...")
-                with open(cache_file, 'r') as f:
-                    cache = json.load(f)
-                print(f"✅ Loaded {len(cache)} pre-computed predictions")
-                return cache
-            except Exception as e:
-                print(f"❌ Error loading cache file {cache_file}: {e}")
-                continue
-    
-    print("❌ No prediction cache found in any location")
-    print("💡 Run 'python precompute_predictions.py' to generate cache")
-    return {}
+    for predictions_dir in possible_dirs:
+        if predictions_dir.is_dir():
+            return predictions_dir
+    return possible_dirs[0]
 
-# Global cache variable
-_predictions_cache = None
+# Global cache variables; budget defaults to 64 MB of prediction files
+PREDICTIONS_CACHE_BYTES = int(os.environ.get("PREDICTIONS_CACHE_BYTES", 64 * 1024 * 1024))
+_predictions_cache = PredictionLRUCache(PREDICTIONS_CACHE_BYTES)
+_predictions_dir = None
+_grid_stores = {}  # grid_size -> (pack version, PredictionGridStore) of the pack last opened
 
-def get_cached_prediction(species_name):
-    """Get prediction from cache"""
-    global _predictions_cache
-    
-    if _predictions_cache is None:
-        _predictions_cache = load_predictions_cache()
-    
-    return _predictions_cache.get(species_name)
+def get_predictions_dir():
+    global _predictions_dir
+    if _predictions_dir is None:
+        _predictions_dir = find_predictions_dir()
+    return _predictions_dir
+
+def prediction_version(species_name, grid_size=DEFAULT_GRID_SIZE):
+    """Modification time and size of the file a species' prediction is read from, or None if there is none
+
+    Callers keeping data derived from a prediction compare versions to notice a new precompute run.
+    """
+    predictions_dir = grid_predictions_dir(get_predictions_dir(), grid_size)
+    version = prediction_grid_version(predictions_dir)
+    if version is not None:
+        return version
+    try:
+        stat = species_prediction_file(predictions_dir, species_name).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def get_prediction_grid_store(grid_size=DEFAULT_GRID_SIZE):
+    """Packed prediction grids for a grid size, reopened whenever precompute re-packs them
+
+    Returns None while there is no pack, without remembering that, so a pack
+    written after the API started is picked up by the next request.
+    """
+    predictions_dir = grid_predictions_dir(get_predictions_dir(), grid_size)
+    version = prediction_grid_version(predictions_dir)
+    if version is None:
+        _grid_stores.pop(grid_size, None)
+        return None
+
+    opened = _grid_stores.get(grid_size)
+    if opened is not None and opened[0] == version:
+        return opened[1]
+    try:
+        store = PredictionGridStore(predictions_dir)
+    except Exception as e:
+        print(f"❌ Error opening packed predictions for grid size {grid_size}: {e}")
+        return None
+    _grid_stores[grid_size] = (version, store)
+    return store
+
+def get_cached_grid(species_name, grid_size=DEFAULT_GRID_SIZE):
+    """Get a species' likelihood grid and its lattice, or None if it is not in the packed file"""
+    store = get_prediction_grid_store(grid_size)
+    if store is None or species_name not in store:
+        return None
+    return store.to_grid(species_name)
+
+def get_cached_prediction(species_name, grid_size=DEFAULT_GRID_SIZE):
+    """Get prediction from the packed grids, or, for directories without a pack, from its GeoJSON file"""
+    # Expanding a grid takes well under a millisecond, so the GeoJSON is built per
+    # request and the grid itself stays in the shared page cache. GeoJSON files
+    # next to a pack may be left from an earlier run, so they are only read without one
+    if prediction_grid_version(grid_predictions_dir(get_predictions_dir(), grid_size)) is not None:
+        store = get_prediction_grid_store(grid_size)
+        if store is None or species_name not in store:
+            return None
+        return store.to_geojson(species_name)
+
+    prediction = _predictions_cache.get((species_name, grid_size))
+    if prediction is not None:
+        return prediction
+
+    species_file = species_prediction_file(grid_predictions_dir(get_predictions_dir(), grid_size), species_name)
+    if not species_file.exists():
+        return None
+
+    try:
+        # The file size on disk is used as the entry's cost against the budget
+        size = species_file.stat().st_size
+        with open(species_file, 'r') as f:
+            prediction = json.load(f)
+    except Exception as e:
+        print(f"❌ Error loading prediction file {species_file}: {e}")
+        return None
+
+    _predictions_cache.put((species_name, grid_size), prediction, size)
+    return prediction
+
+def get_predictions_cache_info():
+    """Get hit, miss and eviction counts of the predictions cache"""
+    info = _predictions_cache.info()
+    info["packed_grids"] = {
+        grid_size: len(store.species_index) for grid_size, (_, store) in _grid_stores.items()
+    }
+    return info
+
+def clear_predictions_cache():
+    """Drop decoded predictions to free memory; packed grids are reopened on next use"""
+    _predictions_cache.clear()
+    _grid_stores.clear()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-compute 2025 predictions for all species")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Number of species models to train together (default: 1, one at a time)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1, in-process)")
+    parser.add_argument("--force", action="store_true",
+                        help="Regenerate predictions even if their fingerprint is unchanged")
+    parser.add_argument("--grid-size", type=int, default=DEFAULT_GRID_SIZE,
+                        help=f"Grid bins along each axis (default: {DEFAULT_GRID_SIZE})")
+    parser.add_argument("--grid-dtype", choices=["float32", "float16"], default="float32",
+                        help="Storage type of the packed likelihood grids (default: float32)")
+    parser.add_argument("--write-geojson", action="store_true",
+                        help="Also write per-species GeoJSON files and all_predictions.json")
+    parser.add_argument("--benchmark-grid-sizes", type=int, nargs="*", metavar="N",
+                        help="Only report layer memory and training time at these grid sizes (default: 20 50 100)")
+    args = parser.parse_args()
+    
+    if args.benchmark_grid_sizes is not None:
+        # Re-binning needs the raw occurrences, so this bypasses the layers artifact
+        from species_inference import Species
+        predictor = Species()
+        predictor.prepare_data()
+        predictor.get_species_names()
+        benchmark_grid_sizes(predictor, args.benchmark_grid_sizes or (20, 50, 100))
+        raise SystemExit(0)
+    
     # Run pre-computation
-    precompute_all_predictions()
\ No newline at end of file
+    precompute_all_predictions(batch_size=max(1, args.batch_size), workers=args.workers, force=args.force,
+                               grid_size=args.grid_size, grid_dtype=args.grid_dtype,
+                               write_geojson=args.write_geojson)
\ No newline at end of file
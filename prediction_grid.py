@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Compact storage of the 2025 prediction likelihood grids
+All species' grids are packed into one memory-mapped .npy array and expanded to GeoJSON on demand
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Written next to each other in a predictions directory; the metadata names the current array file
+PREDICTION_GRID_FILE_PATTERN = "predictions_grid-{token}.npy"
+PREDICTION_GRID_METADATA_FILE = "predictions_grid.json"
+
+def grid_box_feature(species_name: str, prediction_id: int, lon: np.ndarray, lat: np.ndarray,
+                     x_bin: int, y_bin: int, likelihood: float) -> Dict:
+    """GeoJSON grid box of one predicted cell, from the WGS84 grid lattice"""
+    # Opposite corners (x_max, y_min) and (x_min, y_max), as the box exterior gave them
+    min_x, min_y = float(lon[y_bin, x_bin + 1]), float(lat[y_bin, x_bin + 1])
+    max_x, max_y = float(lon[y_bin + 1, x_bin]), float(lat[y_bin + 1, x_bin])
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[
+                [min_x, min_y], [max_x, min_y], [max_x, max_y], [min_x, max_y], [min_x, min_y]
+            ]]
+        },
+        "properties": {
+            "species_name": species_name,
+            "prediction_year": 2025,
+            "prediction_id": prediction_id,
+            "feature_type": "grid_box",
+            "likelihood": float(likelihood) if likelihood > 0 else 0.0
+        }
+    }
+
+def likelihood_grid(grid_bounds: List[Dict], shape) -> np.ndarray:
+    """Dense (y_bin, x_bin) likelihood grid from inference_model's grid bounds; 0 where nothing is predicted"""
+    grid = np.zeros(shape, dtype=np.float32)
+    for bounds in grid_bounds:
+        grid[bounds['y_bin'], bounds['x_bin']] = bounds['likelihood']
+    return grid
+
+def grid_to_geojson(species_name: str, grid: np.ndarray, lon: np.ndarray, lat: np.ndarray) -> Dict:
+    """Expand a likelihood grid into the cached GeoJSON prediction, one box per positive cell"""
+    rows, cols = np.nonzero(grid > 0)
+    features = [
+        grid_box_feature(species_name, i + 1, lon, lat, x_bin, y_bin, likelihood)
+        for i, (y_bin, x_bin, likelihood) in enumerate(zip(rows.tolist(), cols.tolist(), grid[rows, cols].tolist()))
+    ]
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "prediction_info": {
+            "species_name": species_name,
+            "predicted_locations": len(features),
+            "model_type": "CNN-LSTM",
+            "prediction_year": 2025,
+            "grid_size": grid.shape[0]
+        }
+    }
+
+def save_prediction_grid(predictions_dir: Path, species_names: List[str], grids: List[np.ndarray],
+                         lon: np.ndarray, lat: np.ndarray, dtype: str = "float32"):
+    """Pack species' likelihood grids into one array plus metadata, replacing any previous pack
+
+    Each pack gets a new array file named in the metadata, and the metadata is
+    renamed into place last, so a reader always opens a matching pair.
+    """
+    packed = np.stack(grids).astype(dtype) if grids else np.zeros((0,) + (lon.shape[0] - 1, lon.shape[1] - 1), dtype)
+    grid_file = PREDICTION_GRID_FILE_PATTERN.format(token=f"{time.time_ns():x}{os.getpid():x}")
+    metadata = {
+        "grid_file": grid_file,
+        "species": species_names,
+        "shape": list(packed.shape),
+        "dtype": str(packed.dtype),
+        "lon": lon.tolist(),
+        "lat": lat.tolist()
+    }
+
+    metadata_path = predictions_dir / PREDICTION_GRID_METADATA_FILE
+    tmp_metadata = metadata_path.with_name(f"{metadata_path.name}.{os.getpid()}.tmp")
+    np.save(predictions_dir / grid_file, packed)
+    with open(tmp_metadata, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(tmp_metadata, metadata_path)
+
+    # Readers still mapping an older pack keep it open; new readers only see this one
+    for old_file in predictions_dir.glob(PREDICTION_GRID_FILE_PATTERN.format(token="*")):
+        if old_file.name != grid_file:
+            try:
+                old_file.unlink()
+            except OSError:
+                pass
+
+def prediction_grid_version(predictions_dir: Path) -> Optional[Tuple[int, int]]:
+    """Modification time and size of a directory's pack metadata, or None if it has no pack"""
+    try:
+        stat = (Path(predictions_dir) / PREDICTION_GRID_METADATA_FILE).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class PredictionGridStore:
+    """Read-only view of a packed predictions file; grids are paged in from the memory map as needed"""
+
+    def __init__(self, predictions_dir: Path):
+        # A re-pack between reading the metadata and mapping its array removes
+        # that array; the metadata read again then names the new one
+        for attempt in range(3):
+            with open(Path(predictions_dir) / PREDICTION_GRID_METADATA_FILE) as f:
+                metadata = json.load(f)
+            try:
+                self.grids = np.load(Path(predictions_dir) / metadata["grid_file"], mmap_mode='r')
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+        self.species_index = {name: i for i, name in enumerate(metadata["species"])}
+        self.lon = np.array(metadata["lon"])
+        self.lat = np.array(metadata["lat"])
+
+    def __contains__(self, species_name: str) -> bool:
+        return species_name in self.species_index
+
+    def grid(self, species_name: str) -> np.ndarray:
+        return np.asarray(self.grids[self.species_index[species_name]], dtype=np.float32)
+
+    def to_geojson(self, species_name: str) -> Dict:
+        return grid_to_geojson(species_name, self.grid(species_name), self.lon, self.lat)
+
+    def to_grid(self, species_name: str) -> Dict:
+        """Likelihood grid with the WGS84 lattice of its cell corners"""
+        return {
+            "species_name": species_name,
+            "prediction_year": 2025,
+            "shape": list(self.grids.shape[1:]),
+            "dtype": str(self.grids.dtype),
+            "likelihood": self.grid(species_name).tolist(),
+            "lon": self.lon.tolist(),
+            "lat": self.lat.tolist()
+        }
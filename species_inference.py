@@ -8,17 +8,100 @@ import matplotlib.pyplot as plt
 import rasterio, rasterstats
 import contextily
 import os
+from pathlib import Path
 
 import torch
 import torch.nn as nn
 import random
+import hashlib
+import json
+import time
+from collections.abc import Mapping
+
+from prediction_grid import grid_box_feature
+from species_ingest import read_species_years
+
+# CNN-LSTM settings shared by the training paths; part of every prediction fingerprint
+MODEL_CONFIG = {
+    'seed': 48,
+    'hidden_dim': 1,
+    'kernel_size': (3, 3),
+    'learning_rate': 0.001,
+    'n_epochs': 20,
+    'patience': 5,
+}
+
+# Default number of grid bins along each axis of the study extent
+DEFAULT_GRID_SIZE = 20
+
+
+# Sparse store of per-species (year, y_bin, x_bin) occurrence counts
+class SparseLayers(Mapping):
+    def __init__(self, species_names, shape, indptr, coords, counts):
+        """COO counts grouped by species: rows indptr[i]:indptr[i+1] belong to species_names[i]
+
+        coords holds (year, y_bin, x_bin) per occupied cell and shape is the dense
+        (n_years, n_y_bins, n_x_bins) layer shape.
+        """
+        self.species_names = list(species_names)
+        self.shape = tuple(int(n) for n in shape)
+        self.indptr = indptr
+        self.coords = coords
+        self.counts = counts
+        self._codes = {s: i for i, s in enumerate(self.species_names)}
+
+    @classmethod
+    def from_points(cls, species_names, shape, species_codes, year_idx, y_bin, x_bin):
+        """Count points into occupied cells; equivalent to np.add.at on a dense tensor"""
+        n_years, n_y, n_x = shape
+        cell = ((species_codes.astype(np.int64) * n_years + year_idx) * n_y + y_bin) * n_x + x_bin
+        cell, counts = np.unique(cell, return_counts=True)
+        cell, x = np.divmod(cell, n_x)
+        cell, y = np.divmod(cell, n_y)
+        codes, year = np.divmod(cell, n_years)
+        # unique() sorts by cell, so each species' cells are already contiguous
+        indptr = np.searchsorted(codes, np.arange(len(species_names) + 1))
+        coords = np.stack([year, y, x], axis=1).astype(np.int32)
+        return cls(species_names, shape, indptr, coords, counts.astype(np.int32))
+
+    def __getitem__(self, a_species):
+        """Dense (year, y_bin, x_bin) count layer for one species, built on demand"""
+        i = self._codes[a_species]
+        start, end = self.indptr[i], self.indptr[i + 1]
+        layer = np.zeros(self.shape, dtype=int)
+        year, y, x = self.coords[start:end].T
+        layer[year, y, x] = self.counts[start:end]
+        return layer
+
+    def __iter__(self):
+        return iter(self.species_names)
+
+    def __len__(self):
+        return len(self.species_names)
+
+    @property
+    def nnz(self):
+        return len(self.counts)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.coords.nbytes + self.counts.nbytes
+
+    def dense(self):
+        """Full (species, year, y_bin, x_bin) tensor"""
+        tensor = np.zeros((len(self.species_names),) + self.shape, dtype=int)
+        codes = np.repeat(np.arange(len(self.species_names)), np.diff(self.indptr))
+        year, y, x = self.coords.T
+        tensor[codes, year, y, x] = self.counts
+        return tensor
 
 
 # Species class for model training, inference, and visualisation
 class Species:
     def __init__(self, 
                  species_years=np.arange(2001, 2025),
-                 species_directory='species'):
+                 species_directory='species',
+                 species_df=None):
         self.hkmap = rasterio.open('hk.tif', mode='r+')
         self.hkmap_array = self.hkmap.read(1)
         self.districts = gpd.read_file('boundaries/Hong_Kong_District_Boundary.shp')
@@ -28,38 +111,115 @@ class Species:
         self.bound_top = self.hkmap.bounds.top
         self.bound_bottom = self.hkmap.bounds.bottom
         self.extent = (self.bound_left, self.bound_right, self.bound_bottom, self.bound_top)
+        self.crs = self.hkmap.crs
         self.species_years = species_years
         self.species_directory = species_directory
 
-        self.species_df = gpd.GeoDataFrame()
-        for year in self.species_years:
-            try:
-                year_data = gpd.read_file(f'{self.species_directory}/O{year}.shp', engine='pyogrio')
-                year_data['year'] = year
-                self.species_df = pd.concat([self.species_df, year_data], ignore_index=True)
-            except Exception as e:
-                print(f"Error processing {year}: {e}")
-        self.species_df.to_crs(self.hkmap.crs, inplace=True)
-
-    def prepare_data(self, x_bins=20, y_bins=20):
-        self.species_df['date'] = pd.to_datetime(self.species_df['date'])
-        self.species_df['month'] = self.species_df['date'].dt.month
-        self.species_df.drop(columns=['OBJECTID', 'OBJECTID_1'], inplace=True)
-        self.species_df = self.species_df.astype({'year': 'int32'})
-        self.species_df.drop(columns=['Shape__Are', 'Shape__Len', 'date'], inplace=True)
-        self.species_df['centroid'] = self.species_df['geometry'].centroid
-        self.species_df['x'] = self.species_df['centroid'].x
-        self.species_df['y'] = self.species_df['centroid'].y
+        # Years are read concurrently and concatenated once, unless the caller already loaded them
+        if species_df is None:
+            species_df = read_species_years(self.species_directory, self.species_years)
+        self.species_df = species_df.to_crs(self.crs)
+
+    @classmethod
+    def from_artifact(cls, path='processed/species_layers.npz'):
+        """Build a ready-to-train Species from the data processor's binned artifact
+
+        Skips the raw shapefiles, districts and hk.tif; the result supports training,
+        inference and fingerprints but not visualise(). The species tensor is
+        memory-mapped read-only, so processes loading the same artifact share
+        one copy through the page cache.
+        """
+        species = cls.__new__(cls)
+        with np.load(path) as artifact:
+            species.species_names = artifact['species_names'].tolist()
+            species.species_years = artifact['species_years']
+            species.x_bins = artifact['x_bins']
+            species.y_bins = artifact['y_bins']
+            species.extent = tuple(artifact['extent'].tolist())
+            species.crs = str(artifact['crs'])
+            sparse = 'layer_indptr' in artifact.files
+            if sparse:
+                species.species_layers = SparseLayers(
+                    species.species_names, artifact['layer_shape'], artifact['layer_indptr'],
+                    artifact['layer_coords'], artifact['layer_counts'])
+        if sparse:
+            species.species_tensor = None
+        else:
+            species.species_tensor = np.load(tensor_path(path), mmap_mode='r')
+            species.species_layers = {s: species.species_tensor[i] for i, s in enumerate(species.species_names)}
+        species.bound_left, species.bound_right, species.bound_bottom, species.bound_top = species.extent
+        species.hkmap = None
+        species.species_df = None
+        species.species_directory = None
+        species._grid_lattice = None
+        species.grid_cells = species.create_grid(len(species.x_bins) - 1, len(species.y_bins) - 1)
+        return species
+
+    def save_artifact(self, path='processed/species_layers.npz'):
+        """Save the binned species layers, names and grid for Species.from_artifact
+
+        A dense tensor goes in its own .npy next to path so it can be memory-mapped;
+        sparse layers are small enough to live in the npz itself.
+        """
+        layers = {}
+        if isinstance(self.species_layers, SparseLayers):
+            layers = dict(layer_shape=np.array(self.species_layers.shape),
+                          layer_indptr=self.species_layers.indptr,
+                          layer_coords=self.species_layers.coords,
+                          layer_counts=self.species_layers.counts)
+        else:
+            np.save(tensor_path(path), np.ascontiguousarray(self.species_tensor))
+        np.savez(path,
+                 **layers,
+                 species_names=np.array(self.species_names, dtype=str),
+                 species_years=np.asarray(self.species_years),
+                 x_bins=self.x_bins,
+                 y_bins=self.y_bins,
+                 extent=np.array(self.extent, dtype=float),
+                 crs=np.array(self.crs.to_wkt() if hasattr(self.crs, 'to_wkt') else str(self.crs)))
+
+    def prepare_data(self, x_bins=DEFAULT_GRID_SIZE, y_bins=DEFAULT_GRID_SIZE):
+        # Calling again with other bin counts only re-bins; rebuild the layers afterwards
+        if 'x' not in self.species_df.columns:
+            self.species_df['date'] = pd.to_datetime(self.species_df['date'])
+            self.species_df['month'] = self.species_df['date'].dt.month
+            self.species_df.drop(columns=['OBJECTID', 'OBJECTID_1'], inplace=True, errors='ignore')
+            self.species_df = self.species_df.astype({'year': 'int32'})
+            self.species_df.drop(columns=['Shape__Are', 'Shape__Len', 'date'], inplace=True, errors='ignore')
+            self.species_df['centroid'] = self.species_df['geometry'].centroid
+            self.species_df['x'] = self.species_df['centroid'].x
+            self.species_df['y'] = self.species_df['centroid'].y
 
         self.x_bins = np.linspace(self.extent[0], self.extent[1], x_bins + 1)
         self.y_bins = np.linspace(self.extent[2], self.extent[3], y_bins + 1)
-        self.species_df['x_bin'] = pd.cut(self.species_df['x'], bins=self.x_bins, labels=False)
-        self.species_df['y_bin'] = pd.cut(self.species_df['y'], bins=self.y_bins, labels=False)
-
-        self.grid_cells = self.create_grid()
-        self.species_df['grid_id'] = self.species_df.apply(lambda row: self.griding(self.grid_cells, row['x_bin'], row['y_bin']), axis=1)
-
-    def create_grid(self, x_bins=20, y_bins=20):
+        self._grid_lattice = None
+        x_bin, y_bin, grid_id = self.assign_bins(self.species_df['x'].to_numpy(), self.species_df['y'].to_numpy())
+        self.species_df['x_bin'] = x_bin
+        self.species_df['y_bin'] = y_bin
+
+        self.grid_cells = self.create_grid(x_bins, y_bins)
+        self.species_df['grid_id'] = grid_id
+
+    @property
+    def grid_size(self):
+        """Number of (y, x) bins of the current grid"""
+        return len(self.y_bins) - 1, len(self.x_bins) - 1
+
+    def assign_bins(self, x, y):
+        """Vectorised equivalent of pd.cut(labels=False) on both axes plus griding"""
+        n_x = len(self.x_bins) - 1
+        n_y = len(self.y_bins) - 1
+        # Right-closed bins like pd.cut; points on the lower edge, outside the extent or NaN get NaN
+        x_idx = np.digitize(x, self.x_bins, right=True) - 1
+        y_idx = np.digitize(y, self.y_bins, right=True) - 1
+        x_valid = (x_idx >= 0) & (x_idx < n_x)
+        y_valid = (y_idx >= 0) & (y_idx < n_y)
+        x_bin = np.where(x_valid, x_idx, np.nan)
+        y_bin = np.where(y_valid, y_idx, np.nan)
+        grid_id = np.where(x_valid & y_valid, y_idx * n_x + x_idx, np.nan)
+        return x_bin, y_bin, grid_id
+
+    def create_grid(self, x_bins=DEFAULT_GRID_SIZE, y_bins=DEFAULT_GRID_SIZE):
         self.grid_cells = []
         for i in range(y_bins):
             for j in range(x_bins):
@@ -77,17 +237,42 @@ class Species:
                 return grid['id']
         return None
 
-    def species_layer(self, species_df):
-        self.species_layers = {}
-        for s in self.species_names:
-            layer = np.zeros((len(self.species_years), 20, 20), dtype=int)
-            species_data = species_df[species_df['scientific'] == s]
-            for _, row in species_data.iterrows():
-                if pd.notnull(row['x_bin']) and pd.notnull(row['y_bin']):
-                    layer[row['year'] - 2001, int(row['y_bin']), int(row['x_bin'])] += 1
-            self.species_layers[s] = layer
+    def species_layer(self, species_df, sparse=False):
+        # Count occurrences of every species at once into a (species, year, y_bin, x_bin) tensor,
+        # or with sparse=True into a SparseLayers store that only keeps occupied cells
+        n_years = len(self.species_years)
+        species_codes = pd.Categorical(species_df['scientific'], categories=self.species_names).codes
+        year_idx = species_df['year'].to_numpy() - self.species_years[0]
+        x_bin = species_df['x_bin'].to_numpy()
+        y_bin = species_df['y_bin'].to_numpy()
+        valid = ((species_codes >= 0) & pd.notnull(x_bin) & pd.notnull(y_bin)
+                 & (year_idx >= 0) & (year_idx < n_years))
+
+        if sparse:
+            self.species_tensor = None
+            self.species_layers = SparseLayers.from_points(
+                self.species_names, (n_years, len(self.y_bins) - 1, len(self.x_bins) - 1),
+                species_codes[valid], year_idx[valid], y_bin[valid].astype(int), x_bin[valid].astype(int))
+            return None
+
+        self.species_tensor = np.zeros((len(self.species_names), n_years,
+                                        len(self.y_bins) - 1, len(self.x_bins) - 1), dtype=int)
+        np.add.at(self.species_tensor, (species_codes[valid], year_idx[valid],
+                                        y_bin[valid].astype(int), x_bin[valid].astype(int)), 1)
+
+        # Per-species views into the tensor for existing callers
+        self.species_layers = {s: self.species_tensor[i] for i, s in enumerate(self.species_names)}
         return None
 
+    def species_fingerprint(self, a_species):
+        """Hash of the inputs that determine a species' prediction: its layer and MODEL_CONFIG"""
+        layer = np.ascontiguousarray(self.species_layers[a_species])
+        digest = hashlib.sha256()
+        digest.update(f"{layer.dtype}{layer.shape}".encode())
+        digest.update(layer.tobytes())
+        digest.update(json.dumps(MODEL_CONFIG, sort_keys=True).encode())
+        return digest.hexdigest()
+
     def get_species_names(self):
         try:
             self.species_names = sorted(self.species_df['scientific'].unique().tolist())
@@ -135,11 +320,10 @@ class Species:
     def train_model_fast(self, a_species):
         """CNN-LSTM training with optimized parameters"""
         # Set deterministic seed
-        set_seed(48)
+        set_seed(MODEL_CONFIG['seed'])
         
         # Initialize CNN-LSTM model
-        self.model = ConvLSTM(input_dim=1, hidden_dim=1, kernel_size=(3, 3),
-                              num_layers=1, batch_first=True, bias=True, return_all_layers=False)
+        self.model = new_conv_lstm()
         
         # Device setup
         device = torch.device("cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu")
@@ -147,15 +331,15 @@ class Species:
         
         # Loss and optimizer
         criterion = nn.BCELoss()
-        optimizer = torch.optim.Adam(self.model.parameters(), lr=0.001)
+        optimizer = torch.optim.Adam(self.model.parameters(), lr=MODEL_CONFIG['learning_rate'])
         
         # Prepare data in CNN-LSTM format
         species_layer = self.species_layers[a_species]
-        X_train = torch.tensor(species_layer[:22, :, :]).to(torch.float32).reshape(1, 22, 1, 20, 20)
-        y_train = torch.tensor(species_layer[22, :, :]).to(torch.float32).reshape(1, 1, 20, 20)
+        X_train = torch.tensor(species_layer[:22, :, :]).to(torch.float32).reshape(1, 22, 1, *self.grid_size)
+        y_train = torch.tensor(species_layer[22, :, :]).to(torch.float32).reshape(1, 1, *self.grid_size)
         
         # Training loop
-        n_epochs = 20  # Reduced for faster training
+        n_epochs = MODEL_CONFIG['n_epochs']  # Reduced for faster training
         self.model.train()
         best_loss = float('inf')
         early_stopping_counter = 0
@@ -177,14 +361,84 @@ class Species:
             else:
                 early_stopping_counter += 1
             
-            if early_stopping_counter >= 5:
+            if early_stopping_counter >= MODEL_CONFIG['patience']:
                 break
         
         return self.model
 
+    def train_models_batched(self, species_batch):
+        """Train independent CNN-LSTM models for several species at once
+
+        The species are stacked as groups of one grouped ConvLSTM, so each keeps its
+        own weights, loss and early stopping exactly as in train_model_fast.
+        """
+        n_species = len(species_batch)
+
+        # Every per-species model starts from the same seeded weights
+        set_seed(MODEL_CONFIG['seed'])
+        template = new_conv_lstm()
+        batched_model = new_conv_lstm(groups=n_species)
+        with torch.no_grad():
+            for batched_param, param in zip(batched_model.parameters(), template.parameters()):
+                batched_param.copy_(param.repeat(n_species, *[1] * (param.dim() - 1)))
+
+        device = torch.device("cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu")
+        batched_model.to(device)
+
+        # Per-species BCE, summed so each group only receives its own species' gradient
+        criterion = nn.BCELoss(reduction='none')
+        optimizer = torch.optim.Adam(batched_model.parameters(), lr=MODEL_CONFIG['learning_rate'])
+
+        # Species go in the channel dimension: (1, years, n_species, H, W)
+        layers = np.stack([self.species_layers[s] for s in species_batch], axis=1)
+        X_train = torch.tensor(layers[:22]).to(torch.float32).unsqueeze(0)
+        y_train = torch.tensor(layers[22]).to(torch.float32).unsqueeze(0)
+
+        n_epochs = MODEL_CONFIG['n_epochs']
+        batched_model.train()
+        best_loss = [float('inf')] * n_species
+        early_stopping_counter = [0] * n_species
+        stopped_params = [None] * n_species
+
+        for epoch in range(n_epochs):
+            data = X_train.to(device)
+            target = y_train.to(device)
+
+            optimizer.zero_grad()
+            output = batched_model(data)[1][-1][0]
+            species_loss = criterion(output, target).mean(dim=(0, 2, 3))
+            species_loss.sum().backward()
+            optimizer.step()
+
+            # Snapshot each species' weights at the epoch its own early stopping triggers;
+            # later updates to its group cannot affect the other species
+            for k, loss in enumerate(species_loss.tolist()):
+                if stopped_params[k] is not None:
+                    continue
+                if loss < best_loss[k]:
+                    best_loss[k] = loss
+                    early_stopping_counter[k] = 0
+                else:
+                    early_stopping_counter[k] += 1
+                if early_stopping_counter[k] >= MODEL_CONFIG['patience']:
+                    stopped_params[k] = group_params(batched_model, k)
+
+            if all(params is not None for params in stopped_params):
+                break
+
+        # Unpack each group into a regular single-species model
+        models = {}
+        for k, a_species in enumerate(species_batch):
+            params = stopped_params[k] if stopped_params[k] is not None else group_params(batched_model, k)
+            model = new_conv_lstm().to(device)
+            with torch.no_grad():
+                for param, value in zip(model.parameters(), params):
+                    param.copy_(value)
+            models[a_species] = model
+        return models
+
     def inference_model(self, a_species, model):
         """CNN-LSTM inference for 2025 prediction"""
-        model = self.model
         species_layer = self.species_layers[a_species]
         
         # Device setup
@@ -195,17 +449,12 @@ class Species:
             # Use all available years for 2025 prediction
             test_data = torch.tensor(species_layer[-species_layer.shape[0]+2:, :, :]).unsqueeze(0).unsqueeze(2).to(torch.float32).to(device)
             test_output = model(test_data)[1][-1][0]  # Get last hidden state
-            predicted_grid = test_output[:, -1, :, :].cpu().numpy().reshape(20, 20)
-
-        # Process predictions with likelihood values
-        grid_ids = []
-        likelihood_values = []
-        for i in range(20):  # y-axis (rows)
-            for j in range(20):  # x-axis (columns)
-                likelihood_val = predicted_grid[i, j]
-                if likelihood_val > 0:  # Include positive predictions
-                    grid_ids.append((j, i))  # j=x_bin, i=y_bin (correct coordinate mapping)
-                    likelihood_values.append(max(0, likelihood_val))  # Ensure non-negative
+            predicted_grid = test_output[:, -1, :, :].cpu().numpy().reshape(self.grid_size)
+
+        # Process predictions with likelihood values, row by row (y_bin) like the grid ids
+        rows, cols = np.nonzero(predicted_grid > 0)  # Include positive predictions
+        grid_ids = list(zip(cols.tolist(), rows.tolist()))  # (x_bin, y_bin)
+        likelihood_values = predicted_grid[rows, cols].tolist()
 
         # Convert grid_ids to centroids and grid bounds
         centroids = []
@@ -218,6 +467,8 @@ class Species:
             
             # Store actual grid cell bounds with likelihood
             grid_bounds.append({
+                'x_bin': x_bin,
+                'y_bin': y_bin,
                 'x_min': self.x_bins[x_bin],
                 'x_max': self.x_bins[x_bin + 1],
                 'y_min': self.y_bins[y_bin],
@@ -227,6 +478,23 @@ class Species:
 
         return centroids, grid_bounds
     
+    def grid_lattice_wgs84(self):
+        """Longitude and latitude of every grid edge intersection, projected once per grid"""
+        if getattr(self, '_grid_lattice', None) is None:
+            xx, yy = np.meshgrid(self.x_bins, self.y_bins)
+            points = gpd.GeoSeries(gpd.points_from_xy(xx.ravel(), yy.ravel()), crs=self.crs).to_crs('EPSG:4326')
+            self._grid_lattice = (points.x.to_numpy().reshape(xx.shape), points.y.to_numpy().reshape(yy.shape))
+        return self._grid_lattice
+
+    def grid_box_features(self, species_name, grid_bounds):
+        """GeoJSON grid box features for inference_model's grid bounds"""
+        lon, lat = self.grid_lattice_wgs84()
+        return [
+            grid_box_feature(species_name, i + 1, lon, lat, bounds['x_bin'], bounds['y_bin'],
+                             bounds.get('likelihood', 1.0))
+            for i, bounds in enumerate(grid_bounds)
+        ]
+
     def visualise(self, species, centroids):
         # Visualise the centroids on the map
         fig, ax = plt.subplots(figsize=(15, 15))
@@ -243,24 +511,32 @@ class Species:
 
 # CNN-LSTM Model Classes
 class ConvLSTMCell(nn.Module):
-    def __init__(self, input_dim, hidden_dim, kernel_size, bias):
+    def __init__(self, input_dim, hidden_dim, kernel_size, bias, groups=1):
         super(ConvLSTMCell, self).__init__()
         self.input_dim = input_dim
         self.hidden_dim = hidden_dim
         self.kernel_size = kernel_size
         self.padding = kernel_size[0] // 2, kernel_size[1] // 2
         self.bias = bias
-        self.conv = nn.Conv2d(in_channels=self.input_dim + self.hidden_dim,
-                              out_channels=4 * self.hidden_dim,
+        # groups > 1 runs that many independent cells side by side as a grouped convolution;
+        # input and hidden channels are laid out group by group
+        self.groups = groups
+        self.conv = nn.Conv2d(in_channels=self.groups * (self.input_dim + self.hidden_dim),
+                              out_channels=self.groups * 4 * self.hidden_dim,
                               kernel_size=self.kernel_size,
                               padding=self.padding,
-                              bias=self.bias)
+                              bias=self.bias,
+                              groups=self.groups)
 
     def forward(self, input_tensor, cur_state):
         h_cur, c_cur = cur_state
-        combined = torch.cat([input_tensor, h_cur], dim=1)
-        combined_conv = self.conv(combined)
-        cc_i, cc_f, cc_o, cc_g = torch.split(combined_conv, self.hidden_dim, dim=1)
+        b, _, height, width = input_tensor.size()
+        combined = torch.cat([input_tensor.reshape(b, self.groups, self.input_dim, height, width),
+                              h_cur.reshape(b, self.groups, self.hidden_dim, height, width)], dim=2)
+        combined_conv = self.conv(combined.reshape(b, -1, height, width))
+        combined_conv = combined_conv.reshape(b, self.groups, 4 * self.hidden_dim, height, width)
+        cc_i, cc_f, cc_o, cc_g = [cc.reshape(b, self.groups * self.hidden_dim, height, width)
+                                  for cc in torch.split(combined_conv, self.hidden_dim, dim=2)]
         i = torch.sigmoid(cc_i)
         f = torch.sigmoid(cc_f)
         o = torch.sigmoid(cc_o)
@@ -271,12 +547,12 @@ class ConvLSTMCell(nn.Module):
 
     def init_hidden(self, batch_size, image_size):
         height, width = image_size
-        return (torch.zeros(batch_size, self.hidden_dim, height, width, device=self.conv.weight.device),
-                torch.zeros(batch_size, self.hidden_dim, height, width, device=self.conv.weight.device))
+        return (torch.zeros(batch_size, self.groups * self.hidden_dim, height, width, device=self.conv.weight.device),
+                torch.zeros(batch_size, self.groups * self.hidden_dim, height, width, device=self.conv.weight.device))
 
 class ConvLSTM(nn.Module):
     def __init__(self, input_dim, hidden_dim, kernel_size, num_layers,
-                 batch_first=False, bias=True, return_all_layers=False):
+                 batch_first=False, bias=True, return_all_layers=False, groups=1):
         super(ConvLSTM, self).__init__()
         self._check_kernel_size_consistency(kernel_size)
         kernel_size = self._extend_for_multilayer(kernel_size, num_layers)
@@ -290,13 +566,15 @@ class ConvLSTM(nn.Module):
         self.batch_first = batch_first
         self.bias = bias
         self.return_all_layers = return_all_layers
+        self.groups = groups
         cell_list = []
         for i in range(0, self.num_layers):
             cur_input_dim = self.input_dim if i == 0 else self.hidden_dim[i - 1]
             cell_list.append(ConvLSTMCell(input_dim=cur_input_dim,
                                           hidden_dim=self.hidden_dim[i],
                                           kernel_size=self.kernel_size[i],
-                                          bias=self.bias))
+                                          bias=self.bias,
+                                          groups=self.groups))
         self.cell_list = nn.ModuleList(cell_list)
 
     def forward(self, input_tensor, hidden_state=None):
@@ -345,6 +623,23 @@ class ConvLSTM(nn.Module):
             param = [param] * num_layers
         return param
 
+def tensor_path(artifact_path):
+    """Path of the memory-mappable species tensor saved alongside an artifact"""
+    return Path(artifact_path).with_suffix('').with_name(Path(artifact_path).stem + '_tensor.npy')
+
+def new_conv_lstm(groups=1):
+    """CNN-LSTM used for species prediction; groups > 1 holds that many independent models"""
+    return ConvLSTM(input_dim=1, hidden_dim=MODEL_CONFIG['hidden_dim'], kernel_size=MODEL_CONFIG['kernel_size'],
+                    num_layers=1, batch_first=True, bias=True, return_all_layers=False, groups=groups)
+
+def group_params(model, k):
+    """Copy the parameters of group k out of a grouped CNN-LSTM"""
+    params = []
+    for param in model.parameters():
+        group_size = param.shape[0] // model.groups
+        params.append(param.detach()[k * group_size:(k + 1) * group_size].clone())
+    return params
+
 def set_seed(seed=42):
     random.seed(seed)
     np.random.seed(seed)
@@ -378,21 +673,32 @@ def main():
     species_instance.visualise(a_species, centroids)
 
 # Global predictor instance - loaded once at startup
-_global_predictor = None
+SPECIES_ARTIFACT_PATH = 'processed/species_layers.npz'
+# Keep only occupied cells when building layers from the raw shapefiles. Finer grids
+# always do: the dense tensor is about 2 GB at 100x100
+SPARSE_LAYERS = os.environ.get('SPECIES_SPARSE_LAYERS', '0') == '1'
+_global_predictors = {}  # grid size -> Species
 _trained_models_cache = {}
 
-def get_global_predictor():
-    """Get or initialize the global predictor instance"""
-    global _global_predictor
-    if _global_predictor is None:
-        print("🔮 Initializing prediction model...")
-        _global_predictor = Species()
-        _global_predictor.prepare_data()
-        _global_predictor.create_grid()
-        _global_predictor.get_species_names()
-        _global_predictor.species_layer(_global_predictor.species_df)
-        print(f"✅ Prediction model ready with {len(_global_predictor.species_names)} species")
-    return _global_predictor
+def get_global_predictor(grid_size=DEFAULT_GRID_SIZE):
+    """Get or initialize the global predictor instance for a grid of grid_size x grid_size bins"""
+    predictor = _global_predictors.get(grid_size)
+    if predictor is None:
+        print(f"🔮 Initializing prediction model ({grid_size}x{grid_size} grid)...")
+        if os.path.exists(SPECIES_ARTIFACT_PATH):
+            # Binned layers written by data_processor.py; no raw shapefiles needed
+            predictor = Species.from_artifact(SPECIES_ARTIFACT_PATH)
+            if predictor.grid_size != (grid_size, grid_size):
+                predictor = None
+        if predictor is None:
+            predictor = Species()
+            predictor.prepare_data(grid_size, grid_size)
+            predictor.get_species_names()
+            predictor.species_layer(predictor.species_df,
+                                    sparse=SPARSE_LAYERS or grid_size != DEFAULT_GRID_SIZE)
+        _global_predictors[grid_size] = predictor
+        print(f"✅ Prediction model ready with {len(predictor.species_names)} species")
+    return predictor
 
 def fast_predict_with_global_predictor(predictor, species_name):
     """Fast prediction using precomputed cache"""
@@ -401,7 +707,7 @@ def fast_predict_with_global_predictor(predictor, species_name):
         from precompute_predictions import get_cached_prediction
         
         print(f"📂 Loading cached prediction for {species_name}...")
-        prediction = get_cached_prediction(species_name)
+        prediction = get_cached_prediction(species_name, predictor.grid_size[0])
         
         if prediction:
             print(f"✅ Using cached prediction for {species_name}")
@@ -423,37 +729,7 @@ def fast_predict_with_global_predictor(predictor, species_name):
         centroids, grid_bounds = result
         
         # Convert to GeoJSON format
-        import geopandas as gpd
-        from shapely.geometry import Point, box
-        
-        features = []
-        for i, (centroid, bounds) in enumerate(zip(centroids, grid_bounds)):
-            # Convert grid bounds to WGS84
-            grid_box = box(bounds['x_min'], bounds['y_min'], bounds['x_max'], bounds['y_max'])
-            grid_gdf = gpd.GeoDataFrame([1], geometry=[grid_box], crs=predictor.hkmap.crs)
-            grid_wgs84 = grid_gdf.to_crs('EPSG:4326')
-            
-            # Get polygon coordinates
-            poly_coords = list(grid_wgs84.geometry.iloc[0].exterior.coords)
-            min_x, min_y = poly_coords[0]
-            max_x, max_y = poly_coords[2]
-            
-            features.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[
-                        [min_x, min_y], [max_x, min_y], [max_x, max_y], [min_x, max_y], [min_x, min_y]
-                    ]]
-                },
-                "properties": {
-                    "species_name": species_name,
-                    "prediction_year": 2025,
-                    "prediction_id": i + 1,
-                    "feature_type": "grid_box",
-                    "likelihood": float(bounds.get('likelihood', 1.0))
-                }
-            })
+        features = predictor.grid_box_features(species_name, grid_bounds)
         
         return {
             "type": "FeatureCollection",
@@ -495,7 +771,7 @@ def predict_species_locations_2025(species_name):
         
         # Create GeoDataFrame with predictions
         points = [Point(x, y) for x, y in centroids]
-        gdf = gpd.GeoDataFrame(geometry=points, crs=predictor.hkmap.crs)
+        gdf = gpd.GeoDataFrame(geometry=points, crs=predictor.crs)
         gdf_wgs84 = gdf.to_crs('EPSG:4326')
         
         # Convert to GeoJSON format
@@ -529,6 +805,47 @@ def predict_species_locations_2025(species_name):
         print(f"Prediction error for {species_name}: {e}")
         return None
 
+def benchmark_grid_sizes(predictor, grid_sizes=(20, 50, 100), n_species=10):
+    """Time layer building, training and inference of n_species at each grid size
+
+    predictor must hold the raw occurrences (not from_artifact); it is re-binned in
+    place and left at the last size, with sparse layers. Memory is the size the
+    dense layer tensor would have, computed rather than allocated, and of the
+    sparse store; times are in seconds.
+    """
+    species_names = predictor.species_names[:n_species]
+    results = []
+    for grid_size in grid_sizes:
+        predictor.prepare_data(grid_size, grid_size)
+
+        start = time.perf_counter()
+        predictor.species_layer(predictor.species_df, sparse=True)
+        layer_time = time.perf_counter() - start
+        sparse_bytes = predictor.species_layers.nbytes
+        dense_bytes = (len(predictor.species_names) * len(predictor.species_years)
+                       * grid_size * grid_size * np.dtype(int).itemsize)
+
+        start = time.perf_counter()
+        models = {name: predictor.train_model_fast(name) for name in species_names}
+        train_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for name, model in models.items():
+            predictor.inference_model(name, model)
+        inference_time = time.perf_counter() - start
+
+        results.append({
+            "grid_size": grid_size,
+            "dense_layers_mb": dense_bytes / 1e6,
+            "sparse_layers_mb": sparse_bytes / 1e6,
+            "layer_build_s": layer_time,
+            "train_s_per_species": train_time / len(species_names),
+            "inference_s_per_species": inference_time / len(species_names)
+        })
+        print(f"📐 {grid_size}x{grid_size}: layers {dense_bytes / 1e6:.1f} MB dense / "
+              f"{sparse_bytes / 1e6:.2f} MB sparse, train {train_time / len(species_names):.3f} s, "
+              f"inference {inference_time / len(species_names):.4f} s per species")
+    return results
+
 def clear_model_cache():
     """Clear cached models to free memory"""
     global _trained_models_cache
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Shared ingest of the yearly species occurrence shapefiles
+Reads species/O{year}.shp concurrently and concatenates them once
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import geopandas as gpd
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Attribute columns the processor and the predictor use; geometry is always read
+SPECIES_COLUMNS = ['scientific', 'family', 'date']
+
+def read_species_year(species_directory: Path, year: int,
+                      columns: Optional[List[str]] = SPECIES_COLUMNS) -> Optional[gpd.GeoDataFrame]:
+    """Read one year's shapefile, or None if it is missing or unreadable"""
+    file_path = Path(species_directory) / f'O{year}.shp'
+    if not file_path.exists():
+        logger.warning(f"File not found: {file_path}")
+        return None
+    try:
+        # Arrow mode decodes whole columns at once and GDAL releases the GIL while reading
+        year_data = gpd.read_file(file_path, engine='pyogrio', use_arrow=True, columns=columns)
+    except Exception as e:
+        logger.warning(f"Error reading {file_path}: {e}")
+        return None
+    year_data['year'] = year
+    logger.info(f"Loaded {len(year_data)} records from {year}")
+    return year_data
+
+def read_species_years(species_directory='species', years: Iterable[int] = range(2001, 2025),
+                       columns: Optional[List[str]] = SPECIES_COLUMNS,
+                       max_workers: int = 8) -> gpd.GeoDataFrame:
+    """Read the yearly species shapefiles in a thread pool and concatenate them once
+
+    Pass columns=None to read every attribute column.
+    """
+    years = [int(year) for year in years]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(lambda year: read_species_year(species_directory, year, columns), years))
+    frames = [frame for frame in frames if frame is not None]
+
+    if not frames:
+        logger.warning(f"No species files found in {species_directory}")
+        return gpd.GeoDataFrame()
+
+    species = pd.concat(frames, ignore_index=True)
+    logger.info(f"Total loaded: {len(species)} species records from {len(frames)} years")
+    return species
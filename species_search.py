@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+In-memory trigram index for species search
+Supports substring, prefix and typo-tolerant lookups over scientific names and families
+"""
+
+import bisect
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import pandas as pd
+
+# Minimum share of the query's trigrams a name must contain to count as a fuzzy match
+FUZZY_THRESHOLD = 0.45
+
+def trigrams(text: str) -> List[str]:
+    """Overlapping 3-character slices of text"""
+    return [text[i:i + 3] for i in range(len(text) - 2)]
+
+class SpeciesSearchIndex:
+    def __init__(self, families: Dict[str, str]):
+        """Build the index from a mapping of scientific name to family"""
+        # Doc ids follow case-insensitive name order, so prefix matches form a contiguous range
+        self.names = sorted(families, key=str.lower)
+        self.names_lower = [name.lower() for name in self.names]
+
+        # Later words of each name (epithets), sorted for word-prefix lookups
+        self.words = sorted(
+            (word, doc_id)
+            for doc_id, name in enumerate(self.names_lower)
+            for word in name.split()[1:]
+        )
+
+        # Padded so that grams at the start/end of a name also capture word boundaries
+        postings = defaultdict(list)
+        for doc_id, name in enumerate(self.names_lower):
+            for gram in set(trigrams(f"  {name} ")):
+                postings[gram].append(doc_id)
+        self.postings = dict(postings)
+
+        # Few distinct families, so they are matched by scanning the unique values
+        family_docs = defaultdict(list)
+        for doc_id, name in enumerate(self.names):
+            family_docs[str(families[name] or "").lower()].append(doc_id)
+        self.family_docs = dict(family_docs)
+
+    @classmethod
+    def from_species_summary(cls, species_summary: pd.DataFrame) -> "SpeciesSearchIndex":
+        """Build the index from the species summary table, indexed by scientific name"""
+        return cls(species_summary["family"].to_dict())
+
+    def search(self, query: str, limit: int = 50) -> List[str]:
+        """Return up to limit names ranked exact, prefix, word prefix, substring, family, then fuzzy
+
+        Tiers are filled in rank order and the search stops as soon as the page is full.
+        """
+        q = query.lower().strip()
+        if not q or limit <= 0:
+            return []
+
+        results = []
+        seen = set()
+
+        def take(doc_ids):
+            for doc_id in doc_ids:
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    results.append(doc_id)
+                    if len(results) >= limit:
+                        return True
+            return False
+
+        def page():
+            return [self.names[doc_id] for doc_id in results]
+
+        # Exact match sorts first among the names starting with the query
+        start = bisect.bisect_left(self.names_lower, q)
+        end = bisect.bisect_left(self.names_lower, q + "\uffff")
+        if take(range(start, end)):
+            return page()
+
+        start = bisect.bisect_left(self.words, (q,))
+        end = bisect.bisect_left(self.words, (q + "\uffff",))
+        if take(sorted(doc_id for _, doc_id in self.words[start:end])):
+            return page()
+
+        # Substring candidates: docs containing every query trigram (all docs for short queries)
+        q_grams = set(trigrams(q))
+        if q_grams:
+            posting_lists = sorted((self.postings.get(gram, []) for gram in q_grams), key=len)
+            candidates = sorted(set(posting_lists[0]).intersection(*posting_lists[1:]))
+        else:
+            candidates = range(len(self.names))
+        if take(doc_id for doc_id in candidates if q in self.names_lower[doc_id]):
+            return page()
+
+        family_matches = [doc_ids for family, doc_ids in self.family_docs.items() if q in family]
+        if take(sorted(doc_id for doc_ids in family_matches for doc_id in doc_ids)):
+            return page()
+
+        # Typo tolerance: rank remaining names by the share of padded query trigrams they contain
+        fuzzy_grams = set(trigrams(f"  {q} "))
+        hits = Counter()
+        for gram in fuzzy_grams:
+            hits.update(self.postings.get(gram, ()))
+        fuzzy = [(-count, doc_id) for doc_id, count in hits.items()
+                 if count / len(fuzzy_grams) >= FUZZY_THRESHOLD]
+        take(doc_id for _, doc_id in sorted(fuzzy))
+        return page()
+
+def benchmark(index: SpeciesSearchIndex, queries: List[str], repeat: int = 200) -> Dict:
+    """Time index.search over queries; latencies in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "queries": len(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p99_ms": timings[int(len(timings) * 0.99)],
+        "max_ms": timings[-1]
+    }
+
+if __name__ == "__main__":
+    # The summary table the API builds its index from
+    try:
+        species_summary = pd.read_parquet("processed/species_summary.parquet", columns=["scientific_name", "family"])
+    except FileNotFoundError:
+        # Data processed before the summary table existed; the API derives it from the occurrences too
+        occurrences = pd.read_parquet("processed/species_locations.parquet", columns=["scientific_name", "family"])
+        species_summary = occurrences.groupby("scientific_name", as_index=False)["family"].first()
+    species_summary = species_summary.set_index("scientific_name")
+
+    start = time.perf_counter()
+    index = SpeciesSearchIndex.from_species_summary(species_summary)
+    print(f"Built index over {len(index.names)} species in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    queries = ["e", "eg", "egretta", "garzetta", "Egreta garzeta", "idae", "Ardeidae",
+               "papilio", "troides helena", "xyzzy", "Accipiter", "ipiter sol"]
+    stats = benchmark(index, queries)
+    print(f"{stats['queries']} searches: p50 {stats['p50_ms']:.3f} ms, "
+          f"p99 {stats['p99_ms']:.3f} ms, max {stats['max_ms']:.3f} ms")
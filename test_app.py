@@ -0,0 +1,100 @@
+"""Serving the occurrence store while the data processor rewrites it, and its pre-compressed maps"""
+
+import gzip
+import math
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+import vector_tiles
+from data_processor import HKSpeciesDataProcessor
+
+SPECIES = "Aa aa"
+
+def write_store(tmp_path, dates):
+    """Occurrence store with one Hong Kong 1980 Grid point per date, as the data processor writes it"""
+    occurrences = gpd.GeoDataFrame({
+        'scientific_name': SPECIES,
+        'family': "Aaidae",
+        'date': pd.to_datetime(dates),
+        'name_en': "Islands",
+        'lat': 22.3,
+        'lon': 114.1,
+    }, geometry=gpd.points_from_xy([835000.0 + 100 * i for i in range(len(dates))],
+                                   [820000.0] * len(dates)), crs="EPSG:2326")
+    HKSpeciesDataProcessor(tmp_path).save_species_partitions(occurrences, Path(app.SPECIES_LOCATIONS_PATH))
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "processed").mkdir()
+    write_store(tmp_path, ["2019-05-01", "2020-06-01"])
+    for name in ("_occurrence_dataset", "_species_summary", "_species_listing", "_search_index"):
+        monkeypatch.setattr(app, name, None)
+    app.clear_tile_sources()
+    return TestClient(app.app)
+
+def map_dates(client, **params):
+    response = client.get(f"/api/species/{SPECIES}/map", params=params)
+    assert response.status_code == 200
+    return [feature["properties"]["date"] for feature in response.json()["features"]]
+
+def occurrence_tile(z=14):
+    """Tile containing the first stored point"""
+    point = gpd.read_parquet(app.SPECIES_LOCATIONS_PATH).to_crs("EPSG:4326").geometry.iloc[0]
+    n = 2 ** z
+    x = int((point.x + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(point.y))) / math.pi) / 2 * n)
+    return z, x, y
+
+def tile_features(client, z, x, y):
+    response = client.get(f"/tiles/occurrences/{z}/{x}/{y}.mvt", params={"species": SPECIES})
+    assert response.status_code == 200
+    return len(vector_tiles.mapbox_vector_tile.decode(response.content)["occurrences"]["features"])
+
+def test_rewritten_store_is_reopened(client, tmp_path):
+    assert map_dates(client, start_year=2019) == ["2019-05-01", "2020-06-01"]
+
+    write_store(tmp_path, ["2019-05-01", "2020-06-01", "2021-07-01", "2022-08-01"])
+    assert map_dates(client, start_year=2019) == ["2019-05-01", "2020-06-01", "2021-07-01", "2022-08-01"]
+    assert client.get(f"/api/species/{SPECIES}").json()["total_occurrences"] == 4
+
+def test_unreadable_store_is_an_error_not_an_empty_map(client, tmp_path):
+    assert map_dates(client, start_year=2019)
+
+    Path(app.SPECIES_LOCATIONS_PATH).write_bytes(b"PAR1 not a parquet file")
+    assert client.get(f"/api/species/{SPECIES}/map", params={"start_year": 2019}).status_code == 500
+
+@pytest.mark.skipif(vector_tiles.mapbox_vector_tile is None, reason="needs mapbox-vector-tile")
+def test_tiles_of_rewritten_store(client, tmp_path):
+    tile = occurrence_tile()
+    assert tile_features(client, *tile) == 2
+
+    # As the data processor does: rewrite the store, then drop the tiles cut from it
+    write_store(tmp_path, ["2019-05-01", "2020-06-01", "2021-07-01"])
+    vector_tiles.clear_tile_cache()
+    assert tile_features(client, *tile) == 3
+
+def test_decompressed_map_has_its_own_etag(client, tmp_path):
+    path = tmp_path / "processed" / "species_geojson" / f"{SPECIES.replace(' ', '_')}.geojson.gz"
+    path.parent.mkdir()
+    path.write_bytes(gzip.compress(b'{"type": "FeatureCollection", "features": []}'))
+    url = f"/api/species/{SPECIES}/map"
+
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+    decompressed = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in decompressed.headers
+    assert compressed.headers["etag"] != decompressed.headers["etag"]
+
+    # Each representation only revalidates against its own validator
+    for encoding, etag, status in [("identity", compressed.headers["etag"], 200),
+                                   ("identity", decompressed.headers["etag"], 304),
+                                   ("gzip", decompressed.headers["etag"], 200),
+                                   ("gzip", compressed.headers["etag"], 304)]:
+        response = client.get(url, headers={"Accept-Encoding": encoding, "If-None-Match": etag})
+        assert response.status_code == status, (encoding, etag)
@@ -0,0 +1,63 @@
+"""Parity of the grouped species index builder with the row-by-row one it replaced"""
+
+import numpy as np
+import pandas as pd
+
+from data_processor import HKSpeciesDataProcessor
+
+def reference_species_index(species_districts):
+    """Species index as generate_species_index built it before grouping, one row at a time"""
+    species_index = {}
+
+    for _, row in species_districts.iterrows():
+        name = row['scientific_name']
+        if name not in species_index:
+            species_index[name] = {
+                'scientific_name': name,
+                'family': row['family'],
+                'districts': set(),
+                'locations': [],
+                'latest_date': row['date']
+            }
+
+        species_index[name]['districts'].add(row['name_en'])
+        species_index[name]['locations'].append({
+            'lat': float(row['lat']),
+            'lon': float(row['lon']),
+            'district': row['name_en'],
+            'date': row['date'].isoformat()
+        })
+        if row['date'] > species_index[name]['latest_date']:
+            species_index[name]['latest_date'] = row['date']
+
+    for species_data in species_index.values():
+        species_data['districts'] = list(species_data['districts'])
+        species_data['latest_date'] = species_data['latest_date'].isoformat()
+
+    return species_index
+
+def normalise(species_index):
+    # District lists came from a set in the row-wise builder, so compare them unordered
+    return {name: {**data, 'districts': sorted(data['districts'])} for name, data in species_index.items()}
+
+def sample_occurrences(rows=3000):
+    rng = np.random.default_rng(0)
+    names = np.array([f"Genus{i} species{i}" for i in range(40)])
+    districts = np.array(["Central and Western", "Islands", "Sai Kung", "Tai Po", "Yuen Long"])
+    # Species appear interleaved and unsorted, with repeated dates, as they do after the overlay
+    species = names[rng.integers(0, len(names), rows)]
+    return pd.DataFrame({
+        'scientific_name': species,
+        'family': [name.split()[0] + "idae" for name in species],
+        'date': pd.Timestamp("2001-01-01") + pd.to_timedelta(rng.integers(0, 8760, rows), unit="D"),
+        'name_en': districts[rng.integers(0, len(districts), rows)],
+        'lat': rng.uniform(815000, 845000, rows),
+        'lon': rng.uniform(805000, 865000, rows),
+    }, index=rng.permutation(rows))
+
+def test_species_index_matches_rowwise(tmp_path):
+    species_districts = sample_occurrences()
+    species_index = HKSpeciesDataProcessor(tmp_path).generate_species_index(species_districts)
+
+    assert list(species_index) == list(pd.unique(species_districts['scientific_name']))
+    assert normalise(species_index) == normalise(reference_species_index(species_districts))
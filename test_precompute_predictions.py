@@ -0,0 +1,100 @@
+"""Prediction precomputation: resuming interrupted runs, and serving the packed grids it writes"""
+
+import numpy as np
+import pytest
+
+import precompute_predictions
+
+class FakePredictor:
+    """Stands in for Species: records which species are trained, optionally stopping at one"""
+
+    grid_size = (2, 2)
+
+    def __init__(self, species_names, interrupt_at=None):
+        self.species_names = species_names
+        self.fingerprints = {name: f"fingerprint-{name}" for name in species_names}
+        self.interrupt_at = interrupt_at
+        self.trained = []
+        self.likelihood = 0.5
+
+    def species_fingerprint(self, species_name):
+        return self.fingerprints[species_name]
+
+    def train_model_fast(self, species_name):
+        if species_name == self.interrupt_at:
+            raise KeyboardInterrupt
+        self.trained.append(species_name)
+        return species_name
+
+    def inference_model(self, species_name, trained_model):
+        return [(0.0, 0.0)], [{'x_bin': 0, 'y_bin': 1, 'likelihood': self.likelihood}]
+
+    def grid_lattice_wgs84(self):
+        return np.meshgrid(np.linspace(113.8, 114.4, 3), np.linspace(22.1, 22.6, 3))
+
+SPECIES = ["Aa aa", "Bb bb", "Cc cc", "Dd dd"]
+
+def run(monkeypatch, predictor):
+    monkeypatch.setattr(precompute_predictions, "get_global_predictor", lambda grid_size: predictor)
+    return precompute_predictions.precompute_all_predictions()
+
+@pytest.fixture
+def predictions_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # The serving side resolves its directory once and keeps opened packs
+    monkeypatch.setattr(precompute_predictions, "_predictions_dir", tmp_path / "predictions_cache")
+    monkeypatch.setattr(precompute_predictions, "_grid_stores", {})
+    return tmp_path / "predictions_cache"
+
+def likelihood(prediction):
+    return [feature["properties"]["likelihood"] for feature in prediction["features"]]
+
+def test_interrupted_run_skips_finished_species(predictions_dir, monkeypatch):
+    with pytest.raises(KeyboardInterrupt):
+        run(monkeypatch, FakePredictor(SPECIES, interrupt_at="Cc cc"))
+    assert not (predictions_dir / "metadata.json").exists()
+
+    resumed = FakePredictor(SPECIES)
+    assert run(monkeypatch, resumed) == SPECIES
+    assert resumed.trained == ["Cc cc", "Dd dd"]
+
+def test_finished_run_without_metadata_is_reused(predictions_dir, monkeypatch):
+    run(monkeypatch, FakePredictor(SPECIES))
+    (predictions_dir / "metadata.json").unlink()
+
+    rerun = FakePredictor(SPECIES)
+    run(monkeypatch, rerun)
+    assert rerun.trained == []
+
+def test_changed_fingerprint_is_recomputed(predictions_dir, monkeypatch):
+    run(monkeypatch, FakePredictor(SPECIES))
+
+    changed = FakePredictor(SPECIES)
+    changed.fingerprints["Bb bb"] = "fingerprint-new"
+    run(monkeypatch, changed)
+    assert changed.trained == ["Bb bb"]
+    assert precompute_predictions.load_fingerprint(predictions_dir, "Bb bb") == "fingerprint-new"
+
+def test_pack_written_after_startup_is_served(predictions_dir, monkeypatch):
+    assert precompute_predictions.get_cached_prediction("Aa aa") is None
+
+    run(monkeypatch, FakePredictor(SPECIES))
+    assert likelihood(precompute_predictions.get_cached_prediction("Aa aa")) == [0.5]
+
+def test_repack_is_served_without_reload(predictions_dir, monkeypatch):
+    run(monkeypatch, FakePredictor(SPECIES))
+    assert likelihood(precompute_predictions.get_cached_prediction("Aa aa")) == [0.5]
+
+    rerun = FakePredictor(SPECIES)
+    rerun.likelihood = 0.25
+    monkeypatch.setattr(precompute_predictions, "get_global_predictor", lambda grid_size: rerun)
+    precompute_predictions.precompute_all_predictions(force=True)
+    assert likelihood(precompute_predictions.get_cached_prediction("Aa aa")) == [0.25]
+    assert len(list(predictions_dir.glob("predictions_grid-*.npy"))) == 1
+
+def test_geojson_next_to_a_pack_is_not_served(predictions_dir, monkeypatch):
+    run(monkeypatch, FakePredictor(SPECIES))
+    stale = precompute_predictions.species_prediction_file(predictions_dir, "Zz zz")
+    stale.write_text('{"type": "FeatureCollection", "features": []}')
+
+    assert precompute_predictions.get_cached_prediction("Zz zz") is None
@@ -0,0 +1,99 @@
+"""Species grid binning: parity of assign_bins with the pd.cut + griding it replaced, and layer storage per grid size"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import species_inference
+from species_inference import Species
+
+# Hong Kong 1980 Grid extent (left, right, bottom, top), roughly that of hk.tif
+EXTENT = (800000.0, 870000.0, 800000.0, 850000.0)
+
+def make_species(x_bins, y_bins):
+    species = Species.__new__(Species)
+    species.extent = EXTENT
+    species.x_bins = np.linspace(EXTENT[0], EXTENT[1], x_bins + 1)
+    species.y_bins = np.linspace(EXTENT[2], EXTENT[3], y_bins + 1)
+    return species
+
+def reference_bins(species, x, y):
+    """Binning as prepare_data did it before assign_bins"""
+    df = pd.DataFrame({'x': x, 'y': y})
+    df['x_bin'] = pd.cut(df['x'], bins=species.x_bins, labels=False)
+    df['y_bin'] = pd.cut(df['y'], bins=species.y_bins, labels=False)
+    grid_cells = species.create_grid(len(species.x_bins) - 1, len(species.y_bins) - 1)
+    df['grid_id'] = df.apply(lambda row: species.griding(grid_cells, row['x_bin'], row['y_bin']), axis=1)
+    return df['x_bin'].to_numpy(), df['y_bin'].to_numpy(), df['grid_id'].to_numpy(dtype=float)
+
+def sample_points(species):
+    rng = np.random.default_rng(0)
+    left, right, bottom, top = EXTENT
+    width, height = right - left, top - bottom
+
+    # Random points around the extent, so some fall outside it
+    x = [rng.uniform(left - 0.1 * width, right + 0.1 * width, 2000)]
+    y = [rng.uniform(bottom - 0.1 * height, top + 0.1 * height, 2000)]
+
+    # Every bin edge on each axis, including the outer edges, against interior coordinates
+    x.append(species.x_bins)
+    y.append(np.full(len(species.x_bins), (bottom + top) / 2))
+    x.append(np.full(len(species.y_bins), (left + right) / 2))
+    y.append(species.y_bins)
+
+    # Grid corners, NaN coordinates and points just outside each side
+    corners_x, corners_y = np.meshgrid(species.x_bins, species.y_bins)
+    x += [corners_x.ravel(), [np.nan, np.nan, left + 1.0], [left - 1.0, right + 1.0, left + 1.0, left + 1.0]]
+    y += [corners_y.ravel(), [bottom + 1.0, np.nan, np.nan], [bottom + 1.0, bottom + 1.0, bottom - 1.0, top + 1.0]]
+    return np.concatenate(x), np.concatenate(y)
+
+@pytest.mark.parametrize("x_bins, y_bins", [(20, 20), (7, 13), (1, 1)])
+def test_assign_bins_matches_pd_cut_and_griding(x_bins, y_bins):
+    species = make_species(x_bins, y_bins)
+    x, y = sample_points(species)
+
+    expected = reference_bins(species, x, y)
+    actual = species.assign_bins(x, y)
+
+    for name, got, want in zip(("x_bin", "y_bin", "grid_id"), actual, expected):
+        np.testing.assert_array_equal(got, want, err_msg=name)
+        assert got.dtype == np.float64, name
+
+def test_assign_bins_edge_cases():
+    species = make_species(20, 20)
+    left, right, bottom, top = EXTENT
+    inner_x, inner_y = species.x_bins[3], species.y_bins[5]
+
+    x = np.array([left, right, inner_x, np.nan, right + 1.0, (left + right) / 2])
+    y = np.array([top, top, inner_y, inner_y, inner_y, np.nan])
+    x_bin, y_bin, grid_id = species.assign_bins(x, y)
+
+    # Bins are right-closed: the lower edge is outside, the upper edge and inner edges
+    # belong to the bin below them
+    np.testing.assert_array_equal(x_bin, [np.nan, 19, 2, np.nan, np.nan, 9])
+    np.testing.assert_array_equal(y_bin, [19, 19, 4, 4, 4, np.nan])
+    np.testing.assert_array_equal(grid_id, [np.nan, 399, 82, np.nan, np.nan, np.nan])
+
+@pytest.mark.parametrize("grid_size, sparse", [(20, False), (100, True)])
+def test_finer_grids_build_sparse_layers(grid_size, sparse, monkeypatch):
+    built = {}
+
+    class RawSpecies(Species):
+        def __init__(self):
+            self.species_df = None
+            self.species_names = []
+
+        def prepare_data(self, x_bins, y_bins):
+            pass
+
+        def get_species_names(self):
+            pass
+
+        def species_layer(self, species_df, sparse=False):
+            built["sparse"] = sparse
+
+    monkeypatch.setattr(species_inference, "Species", RawSpecies)
+    monkeypatch.setattr(species_inference, "SPECIES_ARTIFACT_PATH", "missing.npz")
+    monkeypatch.setattr(species_inference, "_global_predictors", {})
+    species_inference.get_global_predictor(grid_size)
+    assert built["sparse"] is sparse
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Mapbox vector tile encoding for the map layers
+Clips Web Mercator geometries to a z/x/y tile and caches the encoded tiles on disk
+"""
+
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import geopandas as gpd
+import shapely
+
+try:
+    import mapbox_vector_tile
+    from mapbox_vector_tile.encoder import on_invalid_geometry_make_valid
+except ImportError:
+    mapbox_vector_tile = None
+
+logger = logging.getLogger(__name__)
+
+# Tile-local coordinate range, and the share of a tile drawn around it so that
+# polygon edges at tile borders do not show seams
+TILE_EXTENT = 4096
+TILE_BUFFER = 64 / TILE_EXTENT
+
+# Half the width of the Web Mercator world, in metres
+WEB_MERCATOR_HALF_WORLD = 20037508.342789244
+
+TILE_CACHE_DIR = Path("processed/tiles")
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """EPSG:3857 bounds (min_x, min_y, max_x, max_y) of an XYZ tile"""
+    size = 2 * WEB_MERCATOR_HALF_WORLD / 2 ** z
+    min_x = -WEB_MERCATOR_HALF_WORLD + x * size
+    max_y = WEB_MERCATOR_HALF_WORLD - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= 24 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+def encode_tile(layer_name: str, frame: gpd.GeoDataFrame, z: int, x: int, y: int,
+                properties: List[str]) -> bytes:
+    """Encode the features of an EPSG:3857 frame that touch a tile; b'' if there are none
+
+    Uses the frame's spatial index, so repeated calls on the same frame only
+    visit the features near each tile.
+    """
+    if mapbox_vector_tile is None:
+        raise RuntimeError("mapbox-vector-tile is not installed")
+
+    bounds = tile_bounds(z, x, y)
+    buffer = (bounds[2] - bounds[0]) * TILE_BUFFER
+    clip_box = (bounds[0] - buffer, bounds[1] - buffer, bounds[2] + buffer, bounds[3] + buffer)
+
+    nearby = frame.iloc[frame.sindex.query(shapely.box(*clip_box), predicate="intersects")]
+    if nearby.empty:
+        return b""
+
+    clipped = shapely.clip_by_rect(nearby.geometry.values, *clip_box)
+    records = nearby[properties].to_dict("records")
+    features = [
+        {"geometry": geometry, "properties": record}
+        for geometry, record in zip(clipped, records)
+        if not geometry.is_empty
+    ]
+    if not features:
+        return b""
+
+    return mapbox_vector_tile.encode(
+        [{"name": layer_name, "features": features}],
+        default_options={
+            "quantize_bounds": bounds,
+            "extents": TILE_EXTENT,
+            "y_coord_down": False,
+            "on_invalid_geometry": on_invalid_geometry_make_valid,
+        },
+    )
+
+def tile_cache_path(layer: str, key: str, z: int, x: int, y: int) -> Path:
+    """Cached tile file; key separates the sources of one layer, e.g. species"""
+    return TILE_CACHE_DIR / layer / key.replace(" ", "_") / str(z) / str(x) / f"{y}.mvt"
+
+def read_cached_tile(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+def write_cached_tile(path: Path, tile: bytes):
+    """Write a tile to a temporary file and rename it into place"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(tile)
+    os.replace(tmp_path, path)
+
+def clear_tile_cache(layer: Optional[str] = None):
+    """Delete cached tiles of one layer, or of every layer, after their source data changes"""
+    path = TILE_CACHE_DIR / layer if layer else TILE_CACHE_DIR
+    if path.exists():
+        shutil.rmtree(path)
+        logger.info(f"Cleared tile cache {path}")